@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data files for the benchmarks, in the same formats as the instruments
+write them. Sizes are arguments, so the same generators make small files for a
+quick check and large ones for timing.
+
+Usage:
+
+    >> import generators
+    >> generators.write_pixel(r'path_to_folder', points=400)
+    >> generators.write_time_dep(r'path_to_file.txt', setpoints=10, points=10000)
+
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+_CONFIG = '''[Dimensions]
+Width (um):\t{W}\t
+Length (um):\t20\t
+Thickness (nm):\t40\t
+
+[Transfer]
+Preread (ms): 20000.000
+First Bias (ms): 120000.000
+Vds (V):\t-0.600
+
+[Output]
+Preread (ms): 5000.000
+First Bias (ms): 200.000
+Output Vgs: {n}
+{vgs}
+'''
+
+
+def _write_sweep(path, col, v, i, meta, rng):
+    '''
+    Writes one transfer/output file: the numeric block, a blank row and the metadata
+    '''
+    err = np.abs(i) * 1e-4 * rng.random(len(v))
+    ig = -1e-7 + 1e-8 * rng.standard_normal(len(v))
+    df = pd.DataFrame({col: np.round(v, 6), 'I_DS (A)': i, 'I_DS Error (A)': err,
+                       'I_G (A)': ig, 'I_G Error (A)': np.abs(ig) * 1e-3})
+
+    with open(path, 'w') as f:
+        df.to_csv(f, sep='\t', index=False, float_format='%.6E', lineterminator='\n')
+        f.write('\t\t\n')
+        for key, val in meta:
+            f.write('{} \t{}\t\n'.format(key, val))
+
+    return
+
+
+def write_pixel(folder, points=37, outputs=2, W=4000, seed=0):
+    '''
+    Writes a pixel folder: one transfer curve (forward and reverse sweep of
+    2 * points - 1 gate voltages), outputs output curves and the .cfg file
+
+    points : int, optional
+        Gate voltages per sweep direction (the test devices have 37)
+    outputs : int, optional
+        Number of output curves (Vgs from -0.5 V down)
+    W : float, optional
+        Channel width (um), to give pixels of a wafer different W d / L
+    '''
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    vgs = -0.5 - 0.3 * np.arange(outputs)
+    with open(os.path.join(folder, 'bench_config.cfg'), 'w') as f:
+        f.write(_CONFIG.format(W=W, n=outputs, vgs='\n'.join('Vgs (V) {}:\t{:.3f}'.format(k, vg)
+                                                            for k, vg in enumerate(vgs))))
+
+    # square-law transfer curve turning on below Vt = -0.2 V, with some hysteresis
+    sweep = np.linspace(-0.9, 0, points)
+    v = np.concatenate([sweep, sweep[-2::-1]])
+    vt = np.concatenate([np.full(points, -0.2), np.full(points - 1, -0.25)])
+    k = 5e-3 * W / 4000
+    i = -k * np.clip(vt - v, 0, None) ** 2 - 1e-8 * (1 + rng.random(len(v)))
+    i *= 1 + 1e-3 * rng.standard_normal(len(v))
+    meta = [('V_DS =', '-0.600'), ('Number of Averages =', 5),
+            ('Width/um =', W), ('Length/um =', 20)]
+    _write_sweep(os.path.join(folder, 'bench_transfer_0.txt'), 'V_G', v, i, meta, rng)
+
+    vd = np.concatenate([np.linspace(-0.7, 0, 8), np.linspace(-0.1, -0.7, 7)])
+    for n, vg in enumerate(vgs):
+        vov = np.clip(-0.2 - vg, 0, None)
+        i = -k * np.where(-vd < vov, 2 * vov * -vd - vd ** 2, vov ** 2)
+        meta = [('V_G =', '{:.3f}'.format(vg)), ('Number of Averages =', 5),
+                ('Width/um =', W), ('Length/um =', 20)]
+        _write_sweep(os.path.join(folder, 'bench_output_{}.txt'.format(n)), 'V_DS', vd, i, meta, rng)
+
+    return folder
+
+
+def write_wafer(folder, pixels=8, points=37):
+    '''
+    Writes pixels sub-folders for uC_scale, with widths from 1000 to 4000 um
+
+    Returns the list of pixel folders
+    '''
+    paths = []
+    for n, W in enumerate(np.linspace(1000, 4000, pixels)):
+        paths.append(write_pixel(os.path.join(folder, '{:02d}'.format(n + 1)), points=points,
+                                 W=int(W), seed=n))
+
+    return paths
+
+
+def write_time_dep(path, setpoints=10, points=1000, dt=0.1, seed=0):
+    '''
+    Writes a time-dependent (transient) log for transient.read_time_dep:
+    setpoints gate pulses of points samples each, every dt seconds.
+    As in the instrument files, the time column is in ms
+    '''
+    rng = np.random.default_rng(seed)
+    sp = np.round(np.linspace(-0.9, 0.1, setpoints), 3)
+    t = np.arange(points) * dt
+    tau = 1 + rng.random(setpoints)
+
+    ids = -1e-3 * (1 - np.exp(-t[None, :] / tau[:, None])) * (0.2 - sp[:, None])
+    ids += 1e-6 * rng.standard_normal(ids.shape)
+
+    df = pd.DataFrame({'Time (s)': 1000 * (np.arange(setpoints * points) * dt),
+                       'Setpoint': np.repeat(sp, points),
+                       'Ids (A)': ids.ravel(),
+                       'Error (A)': 1e-7 * rng.standard_normal(ids.size),
+                       'Current (A)': 1e-9 * rng.standard_normal(ids.size),
+                       'Voltage (V)': np.repeat(sp, points) - 0.01 * rng.random(ids.size)})
+    df.to_csv(path, sep='\t', index=False, lineterminator='\n')
+
+    return path
+
+
+def write_spectra(path, runs=100, wavelengths=1024, seed=0):
+    '''
+    Writes a time-dependent spectra file for uvvis.read_time_spectra:
+    runs spectra of wavelengths points each, one second apart
+    '''
+    rng = np.random.default_rng(seed)
+    wl = np.linspace(300.1234, 1000.5678, wavelengths)
+    t = np.arange(runs) + 5.0
+
+    band = np.exp(-((wl - 800) / 100) ** 2)
+    absorbance = band[None, :] * (1 - np.exp(-t[:, None] / 20)) + 0.01 * rng.standard_normal((runs, wavelengths))
+
+    df = pd.DataFrame({'Spectrum number': np.repeat(np.arange(runs) + 1, wavelengths),
+                       'Time (s)': np.repeat(t, wavelengths),
+                       'Wavelength (nm)': np.tile(wl, runs),
+                       'Absorbance': absorbance.ravel()})
+    df.to_csv(path, sep='\t', index=False, lineterminator='\n')
+
+    return path
+
+
+def write_cv(path, cycles=100, period=400, seed=0):
+    '''
+    Writes a cyclic voltammetry export for cv.cv: triangle sweeps between
+    -0.5 and 0.5 V, period samples per cycle
+    '''
+    rng = np.random.default_rng(seed)
+    k = np.arange(cycles * period + period // 2)
+    phase = ((k + period // 4) % period) / period
+    v = np.where(phase < 0.5, 4 * phase - 1, 3 - 4 * phase) * 0.5
+    i = 1e-6 * np.sign(np.gradient(v)) + 1e-6 * v + 1e-8 * rng.standard_normal(len(k))
+
+    df = pd.DataFrame({'Time (s)': k * 0.01 + 1, 'WE(1).Potential (V)': v, 'WE(1).Current (A)': i})
+    df.to_csv(path, sep='\t', index=False, lineterminator='\n')
+
+    return path
+
+
+def write_eis(path, biases=20, frequencies=50, seed=0):
+    '''
+    Writes a multi-bias EIS export for eis.read_eis: an R(RC) response at each
+    bias from 100 kHz to 0.1 Hz, with the fit columns appended (.1)
+    '''
+    rng = np.random.default_rng(seed)
+    f = np.logspace(5, -1, frequencies)
+    names = ["Z' (Ω)", "-Z'' (Ω)", 'Z (Ω)', '-Phase (°)']
+    columns = ['Column 1', 'Column 2 (V)', 'Index', 'Frequency (Hz)'] + names + ['Time (s)'] + names
+
+    lines = ['\t'.join(columns)]
+    for b, v in enumerate(np.round(np.linspace(-0.2, 0.6, biases), 3)):
+
+        if b:
+            lines.append('\t'.join(columns))
+
+        C = 1e-6 * (1 + 20 / (1 + np.exp(-(v - 0.2) / 0.05)))
+        Z = 150 + 1e4 / (1 + 2j * np.pi * f * 1e4 * C)
+        Z *= 1 + 0.005 * rng.standard_normal(frequencies)
+        z = [Z.real, -Z.imag, np.abs(Z), -np.angle(Z, deg=True)]
+
+        for n in range(frequencies):
+            label = ['Potential', repr(v)] if n == 0 else ['', '']
+            row = [n + 1, f[n]] + [x[n] for x in z] + [n * 2.0] + [x[n] for x in z]
+            lines.append('\t'.join(label + ['{:.6g}'.format(x) for x in row]))
+
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+    return path
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Times the processing hot paths on synthetic data (see generators.py) and
+compares each with a stored baseline, so slowdowns show up
+
+Each benchmark is timed like timeit: enough calls to take at least 0.2 s,
+repeated, keeping the fastest. Baselines are per size, in baseline.json next
+to this file, and are only meaningful on the machine that saved them.
+
+Usage (from the repository folder):
+
+    >> python benchmarks/run_benchmarks.py                  # compare with the baseline
+    >> python benchmarks/run_benchmarks.py --save           # store a new baseline
+    >> python benchmarks/run_benchmarks.py --size large -k uvvis
+
+Exits with status 1 if any benchmark is more than --threshold times slower
+than its baseline.
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import cv
+import eis
+import oect
+import oect_load
+import transient
+import uvvis
+
+import generators
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+# generator arguments for each size
+SIZES = {'small': {'points': 37, 'pixels': 8, 'setpoints': 10, 'samples': 2000,
+                   'runs': 100, 'wavelengths': 1024, 'potentials': 3, 'band': 50,
+                   'cycles': 100, 'biases': 20, 'frequencies': 50, 'friedlein': 1000},
+         'large': {'points': 200, 'pixels': 24, 'setpoints': 20, 'samples': 50000,
+                   'runs': 300, 'wavelengths': 1024, 'potentials': 8, 'band': 200,
+                   'cycles': 1000, 'biases': 100, 'frequencies': 100, 'friedlein': 100000}}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    '''
+    Registers a benchmark. The decorated function is called as func(folder, size)
+    to make its data and returns the function to time (called with no arguments)
+    '''
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+@benchmark('oect.OECT.__init__')
+def bench_oect_init(folder, size):
+
+    pixel = generators.write_pixel(os.path.join(folder, 'pixel'), points=size['points'])
+
+    return lambda: oect.OECT(pixel)
+
+
+@benchmark('oect.OECT.calc_gms')
+def bench_calc_gms(folder, size):
+
+    dv = oect.OECT(generators.write_pixel(os.path.join(folder, 'pixel'), points=size['points']))
+
+    # calc_gms adds columns to dv.gms on every call, so start each call from none
+    def run():
+        dv.gm_fwd, dv.gm_bwd, dv.gms = {}, {}, pd.DataFrame()
+        dv.calc_gms()
+
+    return run
+
+
+@benchmark('oect.OECT.thresh')
+def bench_thresh(folder, size):
+
+    dv = oect.OECT(generators.write_pixel(os.path.join(folder, 'pixel'), points=size['points']))
+    dv.calc_gms()
+
+    return dv.thresh
+
+
+@benchmark('oect_load.uC_scale')
+def bench_uc_scale(folder, size):
+
+    paths = generators.write_wafer(os.path.join(folder, 'wafer'), pixels=size['pixels'],
+                                   points=size['points'])
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            oect_load.uC_scale(list(paths), plot=[False, False], verbose=False)
+
+    return run
+
+
+@benchmark('transient.read_time_dep')
+def bench_read_time_dep(folder, size):
+
+    path = generators.write_time_dep(os.path.join(folder, 'time_dep.txt'),
+                                     setpoints=size['setpoints'], points=size['samples'])
+
+    return lambda: transient.read_time_dep(path)
+
+
+@benchmark('transient.friedlein_multi')
+def bench_friedlein_multi(folder, size):
+
+    t = np.linspace(0, 10, size['friedlein'])
+
+    return lambda: transient.friedlein_multi(t, 1, 1e-7, 1e-7, 20e-4, -0.5, 100, 0.2, -0.6, 0)
+
+
+@benchmark('uvvis._single_time_spectra')
+def bench_single_time_spectra(folder, size):
+
+    path = generators.write_spectra(os.path.join(folder, 'spectra.txt'), runs=size['runs'],
+                                    wavelengths=size['wavelengths'])
+    uv = uvvis.uv_vis()
+
+    return lambda: uv._single_time_spectra(path)
+
+
+def _uv_vis(folder, size):
+    '''
+    A uv_vis object with time-dependent spectra at size['potentials'] potentials
+    '''
+    specs = [generators.write_spectra(os.path.join(folder, 'spectra_{}.txt'.format(n)), runs=size['runs'],
+                                      wavelengths=size['wavelengths'], seed=n)
+             for n in range(size['potentials'])]
+
+    uv = uvvis.uv_vis(None, specs, np.round(np.linspace(0, 1, size['potentials']), 2))
+    uv.time_dep_spectra(specs, smooth=3)
+
+    return uv
+
+
+@benchmark('uvvis.banded_fits (exp)')
+def bench_banded_fits_exp(folder, size):
+
+    uv = _uv_vis(folder, size)
+    wl = uv.spectra_vs_time[1.0].index.values
+
+    return lambda: uv.banded_fits(wl[400], wl[400 + size['band']], voltage=1.0, fittype='exp', method='vp')
+
+
+@benchmark('uvvis.banded_fits (biexp)')
+def bench_banded_fits_biexp(folder, size):
+
+    uv = _uv_vis(folder, size)
+    wl = uv.spectra_vs_time[1.0].index.values
+
+    return lambda: uv.banded_fits(wl[400], wl[400 + size['band']], voltage=1.0, fittype='biexp', method='vp')
+
+
+@benchmark('uvvis.save_h5')
+def bench_save_h5(folder, size):
+
+    uv = _uv_vis(folder, size)
+    path = os.path.join(folder, 'spectra.h5')
+
+    return lambda: uvvis.save_h5(uv, path)
+
+
+@benchmark('uvvis.convert_h5')
+def bench_convert_h5(folder, size):
+
+    path = os.path.join(folder, 'spectra.h5')
+    uvvis.save_h5(_uv_vis(folder, size), path)
+
+    return lambda: uvvis.convert_h5(path, lazy=False)
+
+
+@benchmark('cv.cv (with int_current)')
+def bench_cv(folder, size):
+
+    path = generators.write_cv(os.path.join(folder, 'cv.txt'), cycles=size['cycles'])
+
+    def run():
+        cv.cv(path).int_current()
+
+    return run
+
+
+@benchmark('eis.read_eis')
+def bench_read_eis(folder, size):
+
+    path = generators.write_eis(os.path.join(folder, 'eis.txt'), biases=size['biases'],
+                                frequencies=size['frequencies'])
+
+    return lambda: eis.read_eis(path)
+
+
+@benchmark('eis.fit_biases')
+def bench_fit_biases(folder, size):
+
+    path = generators.write_eis(os.path.join(folder, 'eis.txt'), biases=size['biases'],
+                                frequencies=size['frequencies'])
+    edv = eis.read_eis(path)
+
+    return lambda: eis.fit_biases(edv, 'randles_cpe')
+
+
+def time_it(func, repeat=5):
+    '''
+    Seconds per call of func, the fastest of repeat timeit runs
+    '''
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(names, size, repeat=5, folder=None):
+    '''
+    Makes the data for and times each benchmark in names
+
+    Returns a dict of benchmark name: seconds per call
+    '''
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        for name in names:
+
+            data = os.path.join(folder or tmp, name.split()[0])
+            os.makedirs(data, exist_ok=True)
+
+            results[name] = time_it(BENCHMARKS[name](data, SIZES[size]), repeat=repeat)
+            print('{:<32}{:>12.4g} s'.format(name, results[name]), flush=True)
+
+    return results
+
+
+def load_baseline(path=BASELINE):
+
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, size, path=BASELINE):
+    '''
+    Stores results as the baseline for size, keeping the other sizes
+    '''
+    baselines = load_baseline(path)
+    stored = baselines.get(size, {}).get('results', {})
+    stored.update(results)
+
+    baselines[size] = {'machine': platform.node(), 'processor': platform.machine(),
+                       'python': platform.python_version(), 'numpy': np.__version__,
+                       'results': stored}
+
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+    return
+
+
+def compare(results, baseline, threshold=1.5):
+    '''
+    Prints each result against the baseline
+
+    Returns the names of the benchmarks more than threshold times slower
+    '''
+    slower = []
+
+    print('\n{:<32}{:>12}{:>12}{:>8}'.format('benchmark', 'time (s)', 'baseline', 'ratio'))
+
+    for name, t in results.items():
+
+        if name not in baseline:
+            print('{:<32}{:>12.4g}{:>12}'.format(name, t, '-'))
+            continue
+
+        ratio = t / baseline[name]
+        flag = '  SLOWER' if ratio > threshold else ''
+        if flag:
+            slower.append(name)
+
+        print('{:<32}{:>12.4g}{:>12.4g}{:>8.2f}{}'.format(name, t, baseline[name], ratio, flag))
+
+    return slower
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Times the OECT processing hot paths')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('-k', dest='match', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='ratio to the baseline that counts as a slowdown')
+    parser.add_argument('--data', default=None,
+                        help='folder to write the synthetic data in (default is a temporary one)')
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter('ignore')
+
+    names = [n for n in BENCHMARKS if args.match in n]
+    results = run(names, args.size, repeat=args.repeat, folder=args.data)
+
+    if args.save:
+        save_baseline(results, args.size, args.baseline)
+        print('\nSaved the baseline for', args.size, 'to', args.baseline)
+        return 0
+
+    baseline = load_baseline(args.baseline).get(args.size, {}).get('results', {})
+    slower = compare(results, baseline, args.threshold)
+
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
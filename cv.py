@@ -36,45 +36,45 @@ class cv:
         return
 
     def slice_cv(self):
+        '''
+        Splits the current into cycles of one period each
 
-        self.df_time = pd.DataFrame()
-        self.df_volt = pd.DataFrame()
+        The cycles are a (cycles x period) reshape of the current trace, so
+        self.cycle_current and the columns of df_volt/df_time are views of
+        self.i rather than copies. A trailing partial cycle is dropped.
+        '''
 
         peaks = sps.find_peaks(self.v)[0]
 
-        self.cycles = len(peaks)
-
         period = np.abs(peaks[1] - peaks[0])
-
+        self.cycles = min(len(peaks), len(self.i) // period)
         self.period = period
+
         vx = self.v[:period]
         tx = self.t[:period]
 
-        for i in np.arange(self.cycles):
-            self.df_volt[i] = self.i[period * i:period * (i + 1)].values
-            self.df_time[i] = self.i[period * i:period * (i + 1)].values
+        self.cycle_current = self.i.values[:period * self.cycles].reshape(self.cycles, period)
 
-        self.df_volt = self.df_volt.set_index(vx)
-        self.df_time = self.df_time.set_index(tx)
+        self.df_volt = pd.DataFrame(self.cycle_current.T, index=pd.Index(vx), copy=False)
+        self.df_time = pd.DataFrame(self.cycle_current.T, index=pd.Index(tx), copy=False)
 
         return
 
     def int_current(self):
+        '''
+        Integrates the current over the anodic (+) and cathodic (-) half of
+        every cycle, for all cycles at once
 
-        cvc = np.array([])
-        p = int(self.period / 2)
+        Both halves are integrated against the time axis of the first half
+        cycle, so each cycle is on the same footing.
+        '''
 
-        for c in self.df_time.columns:
-            cvc = np.append(cvc, [trapz(self.df_time[c].iloc[:p], self.t[:p]),
-                                  trapz(self.df_time[c].iloc[p:], self.t[:p])])
-
-        cvc = np.reshape(cvc, [self.cycles, 2])
-
-        df = pd.DataFrame()
+        p = int(self.period / 2)
+        t = self.t.values
 
-        for i, x in zip(cvc, range(self.cycles)):
-            df[x] = i
+        cvc = np.column_stack([trapz(self.cycle_current[:, :p], t[:p], axis=1),
+                               trapz(self.cycle_current[:, p:], t[:self.period - p], axis=1)])
 
-        df = df.rename({0: '+', 1: '-'}, axis='index')
+        df = pd.DataFrame(cvc.T, index=['+', '-'])
 
         self.current_vs_cycle = df
@@ -1,12 +1,14 @@
 from scipy import signal as sps
 import numpy as np
 import warnings
+import profiling
 
 """
 Derivative for generating gm from Id-Vg plots
 """
 
 
+@profiling.stage('deriv.gm_deriv')
 def gm_deriv(v, i, method='raw', fit_params={'window': 11, 'polyorder': 2, 'deg': 8}):
     if method == 'sg':
         # Savitsky-Golay method
@@ -29,3 +31,38 @@ def gm_deriv(v, i, method='raw', fit_params={'window': 11, 'polyorder': 2, 'deg'
         return
 
     return gml
+
+
+@profiling.stage('deriv.gm_deriv_batch')
+def gm_deriv_batch(v, i, method='raw', fit_params={'window': 11, 'polyorder': 2, 'deg': 8}):
+    """
+    Same as gm_deriv, but for many Id-Vg sweeps taken on the same voltages
+
+    v : ndarray
+        Voltages, shared by all sweeps (N,)
+    i : ndarray
+        Currents, one sweep per column (N, M)
+
+    Returns gm as an (N, M) array
+    """
+    i = np.asarray(i, dtype=float)
+    dv = v[2] - v[1]
+
+    if method == 'sg':
+        window = fit_params['window']
+        if not window & 1:  # is odd
+            window += 1
+        gml = sps.savgol_filter(i, window_length=window, polyorder=fit_params['polyorder'],
+                                deriv=1, delta=dv, axis=0)
+    elif method == 'raw':
+        gml = np.gradient(i, dv, axis=0)
+
+    elif method == 'poly':
+        funclo = np.polyfit(v, i, fit_params['deg'])
+        gml = np.gradient(np.vander(v, fit_params['deg'] + 1) @ funclo, dv, axis=0)
+
+    else:
+        warnings.warn('Bad gm_method, aborting')
+        return
+
+    return gml
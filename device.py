@@ -5,9 +5,13 @@ Created on Wed Apr 24 10:16:43 2019
 @author: Raj
 """
 
+import os
+
+import h5py
 import numpy as np
-from scipy.optimize import curve_fit as cf
+import pandas as pd
 
+import linreg
 import oect_plot
 import oect_load
 
@@ -138,18 +142,12 @@ class OECTDevice:
                 params['L'] = self.pixels[pixel].L
                 params['d'] = self.pixels[pixel].d
 
-        # fit functions
-        def line_f(x, a, b):
-
-            return a + b * x
-
-        def line_0(x, b):
-            'no y-offset --> better log-log fits'
-            return b * x
-
+        # closed-form fits; uC_0 has no y-offset --> better log-log fits
         # * 1e2 to get into right mobility units (cm)
-        uC_0, _ = cf(line_0, Wd_L * Vg_Vt, gms)
-        uC, _ = cf(line_f, Wd_L * Vg_Vt, gms)
+        slope, _, _, _, _ = linreg.line_fit(Wd_L * Vg_Vt, gms, intercept=False)
+        uC_0 = np.array([slope])
+        slope, icpt, _, _, _ = linreg.line_fit(Wd_L * Vg_Vt, gms)
+        uC = np.array([icpt, slope])
 
         # Create an OECT and add arrays 
         params['WdL'] = Wd_L
@@ -186,3 +184,193 @@ def save(dv, append=''):
         pickle.dump(dv, output, pickle.HIGHEST_PROTOCOL)
 
     return
+
+
+# what save_h5 stores for each pixel
+PIXEL_SCALARS = ['W', 'L', 'd', 'WdL', 'Vt']
+PIXEL_ARRAYS = ['Vts', 'VgVts', 'peak_gm']
+PIXEL_FRAMES = ['transfers', 'outputs', 'gms']
+
+
+def save_h5(dv, filename=None):
+    '''
+    Saves the processed pixels and uC* results of an OECTDevice as HDF5 (.h5)
+
+    Unlike save, this only stores arrays (no pickled objects), one group per pixel.
+    Each of transfers/outputs/gms is stored as its index plus a 2-D array with
+    one chunk per column, so load_h5 can read single pixels/columns.
+
+    To save the output of oect_load.uC_scale directly:
+        >> pixels, uC_dv = oect_load.uC_scale(paths)
+        >> device.save_h5(device.OECTDevice(pixels=pixels, params=uC_dv), 'uC.h5')
+
+    dv : OECTDevice
+    filename : str, optional
+        Defaults to uC_data.h5 in dv.path
+    '''
+    if filename is None:
+        filename = os.path.join(dv.path, 'uC_data.h5')
+
+    with h5py.File(filename, 'w') as f:
+
+        f.attrs['path'] = str(dv.path)
+
+        grp = f.create_group('params')
+        for p in dv.params:
+            if isinstance(dv.params[p], str):
+                grp.attrs[p] = dv.params[p]
+            else:
+                grp.create_dataset(p, data=np.asarray(dv.params[p], dtype=float))
+
+        pix = f.create_group('pixels')
+        for n, key in enumerate(dv.pixels):
+
+            pixel = dv.pixels[key]
+            grp = pix.create_group(str(n))
+            grp.attrs['key'] = str(key)
+            grp.attrs['folder'] = str(pixel.folder)
+
+            for a in PIXEL_SCALARS:
+                grp.attrs[a] = float(getattr(pixel, a))
+
+            for a in PIXEL_ARRAYS:
+                grp.create_dataset(a, data=np.atleast_1d(np.asarray(getattr(pixel, a), dtype=float)))
+
+            for a in PIXEL_FRAMES:
+                _write_frame(grp.create_group(a), getattr(pixel, a))
+
+    return
+
+
+def load_h5(filename):
+    '''
+    Opens a file written by save_h5. Nothing but the uC* parameters is read
+    until a pixel's attributes are used, and frame() reads only some columns.
+
+        >> dv = device.load_h5('uC.h5')
+        >> dv.params['uC_0']
+        >> dv.pixels[key].peak_gm
+        >> dv.pixels[key].frame('transfers', columns=['-0.6_0_01'])
+        >> dv.close()
+
+    Returns
+    -------
+    H5Device
+    '''
+    return H5Device(filename)
+
+
+def _write_frame(grp, df):
+
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+
+    grp.attrs.create('columns', [str(c) for c in df.columns], dtype=h5py.string_dtype())
+    grp.create_dataset('index', data=np.asarray(df.index.values, dtype=float))
+
+    values = np.asarray(df.values, dtype=float)
+    chunks = (values.shape[0], 1) if values.size else None
+    grp.create_dataset('values', data=values, chunks=chunks)
+
+    return
+
+
+class H5Device:
+    '''
+    Read-only view of a file written by save_h5, see load_h5
+
+    params : dict
+        uC* parameters, as in OECTDevice.params
+    pixels : dict of H5Pixel
+        Same keys as the saved OECTDevice.pixels
+    '''
+
+    def __init__(self, filename):
+
+        self.file = h5py.File(filename, 'r')
+        self.path = self.file.attrs['path']
+
+        self.params = {}
+        params = self.file['params']
+        for p in params.attrs:
+            self.params[p] = params.attrs[p]
+        for p in params:
+            self.params[p] = params[p][()]
+
+        # h5py lists groups in name order ('0', '1', '10', ...), not saved order
+        self.pixels = {}
+        for n in sorted(self.file['pixels'], key=int):
+            grp = self.file['pixels'][n]
+            self.pixels[grp.attrs['key']] = H5Pixel(grp)
+
+        return
+
+    def close(self):
+
+        self.file.close()
+
+        return
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+
+class H5Pixel:
+    '''
+    One pixel from save_h5. Has the same attributes as the saved OECT
+    (W, L, d, WdL, Vt, Vts, VgVts, peak_gm, transfers, outputs, gms, folder),
+    each read from disk when first used
+    '''
+
+    def __init__(self, grp):
+
+        self._grp = grp
+        self._cache = {}
+        self.folder = grp.attrs['folder']
+
+        return
+
+    def __getattr__(self, name):
+
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name not in self._cache:
+
+            if name in PIXEL_SCALARS:
+                self._cache[name] = self._grp.attrs[name]
+            elif name in PIXEL_ARRAYS:
+                self._cache[name] = self._grp[name][()]
+            elif name in PIXEL_FRAMES:
+                self._cache[name] = self.frame(name)
+            else:
+                raise AttributeError(name)
+
+        return self._cache[name]
+
+    def frame(self, name, columns=None):
+        '''
+        Reads transfers, outputs or gms as a DataFrame
+
+        columns : list of str, optional
+            Only read these columns
+        '''
+        grp = self._grp[name]
+        # variable-length strings read back as bytes with some h5py versions
+        names = [c.decode() if isinstance(c, bytes) else str(c) for c in grp.attrs['columns']]
+        index = grp['index'][()]
+
+        if columns is None:
+            return pd.DataFrame(grp['values'][()], index=index, columns=names)
+
+        idx = [names.index(c) for c in columns]
+        order = np.argsort(idx)
+        values = np.empty((len(index), len(idx)))
+        values[:, order] = grp['values'][:, sorted(idx)]
+
+        return pd.DataFrame(values, index=index, columns=columns)
@@ -5,41 +5,78 @@ Created on Thu Jun  6 13:58:00 2019
 @author: Raj
 """
 
+import io
+import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
+from scipy.optimize import least_squares
+from concurrent.futures import ProcessPoolExecutor
 
-def read_eis(path):
+def read_eis(path, stacked=False):
     '''
-    Note that you probably need to recast this as a float
-    
     Some notes on the data:
         As saved, these are saving BOTH the measurement and the simulation fit
         Columns 3-9 are the measured data
         Columns 10+ are the fit data (appended with a .1, e.g. Phase.1)
+        Each voltage block starts on a row labeled in Column 1 with the voltage
+        in Column 2, and is followed by a repeat of the header row
+    
+    The blocks are found in one pass over the lines of the file, and only the
+    numeric rows are parsed, straight to float (no object-dtype frame)
+    
+    path : str
+        Path to the EIS export
+    stacked : bool, optional
+        Return all voltages in one DataFrame instead of a dict
         
     Returns:
         edv : Dict
             Dict with each voltage as a key (e.g. edv[0.7] is the 0.7 V run)
+        
+        or, if stacked
+        
+        df : DataFrame
+            Indexed by ('Bias (V)', 'Point'), e.g. df.loc[0.7] is the 0.7 V run
+            and df['Z (Ω)'].unstack() is a bias x frequency table
     '''
     
-    edv = {}
-    df = pd.read_csv(path, sep='\t')
+    with open(path, encoding='utf-8') as f:
+        lines = [ln for ln in f.read().splitlines() if ln.strip()]
     
-    # finds the string locations and assigns the segments to the dicitonary
-    # The +1 and +2 are due to the way extraneous values are saved in 
-    nm = []
+    # finds the string locations: a labeled row starts a block, and the row
+    # before the next label (the repeated header) ends it. Line 0 is the header
+    rows = []
+    starts = []
     volts = []
-    c = df['Column 1'].values
-    for k, x in zip(c, range(len(c))):
-        if isinstance(k, str):
-            if 'Column' not in k:
-                nm.append(x+1)
-                volts.append(float(df.iloc[x]['Column 2 (V)']))
-    nm.append(len(c)+2)
+    for x, ln in enumerate(lines[1:]):
+        if ln[0] != '\t' and ln.split('\t', 1)[0].strip():
+            k = ln.split('\t', 2)
+            if 'Column' in k[0]:
+                continue
+            if starts and rows[-1] == x - 1:
+                rows.pop()
+            starts.append(len(rows))
+            volts.append(float(k[1]))
+        if starts:
+            rows.append(x)
+    starts.append(len(rows))
+    
+    lines = [lines[0]] + [lines[x + 1] for x in rows]
+    data = pd.read_csv(io.StringIO('\n'.join(lines)), sep='\t', dtype=float,
+                       usecols=lambda c: c not in ['Column 1', 'Column 2 (V)'])
+    data.index = rows
+    
+    if stacked:
+        
+        lengths = np.diff(starts)
+        data.index = pd.MultiIndex.from_arrays([np.repeat(volts, lengths),
+                                                np.arange(len(rows)) - np.repeat(starts[:-1], lengths)],
+                                               names=['Bias (V)', 'Point'])
+        return data
+    
+    edv = {}
     for v, x in zip(volts, range(len(volts))):
-        edv[v] = df.iloc[nm[x]-1:nm[x+1]-2]
-        edv[v] = edv[v].drop(columns=['Column 1', 'Column 2 (V)'])
-        edv[v] = edv[v].astype(float)
+        edv[v] = data.iloc[starts[x]:starts[x + 1]].copy()
     
     return edv    
 
@@ -67,4 +104,200 @@ def plot_nyquist(df):
     
     ax.set_xlabel("Z' (Ω)")
     ax.set_ylabel("-Z'' (Ω)")
-    return
\ No newline at end of file
+    return
+
+def z_rc(f, Rs, Rp, C):
+    '''
+    R(RC) circuit: series resistance Rs and a parallel Rp, C
+    
+    Returns the complex impedance and its Jacobian (frequency x [Rs, Rp, C])
+    '''
+    jw = 2j * np.pi * np.asarray(f)
+    D = 1 + jw * Rp * C
+    
+    Z = Rs + Rp / D
+    jac = np.column_stack([np.ones_like(D), 1 / D**2, -jw * Rp**2 / D**2])
+    
+    return Z, jac
+
+def z_randles_cpe(f, Rs, Rct, Q, n):
+    '''
+    Randles circuit with a constant phase element: series resistance Rs and
+    a charge transfer resistance Rct in parallel with a CPE, 1 / (Q * (jw)**n)
+    
+    Returns the complex impedance and its Jacobian (frequency x [Rs, Rct, Q, n])
+    '''
+    jw = 2j * np.pi * np.asarray(f)
+    s = jw**n
+    D = 1 + Rct * Q * s
+    
+    Z = Rs + Rct / D
+    dQ = -Rct**2 * s / D**2
+    jac = np.column_stack([np.ones_like(D), 1 / D**2, dQ, dQ * Q * np.log(jw)])
+    
+    return Z, jac
+
+# circuit name : (impedance function, parameter names, lower bounds, upper bounds)
+CIRCUITS = {'RC': (z_rc, ['Rs', 'Rp', 'C'], [0, 0, 0], [np.inf, np.inf, np.inf]),
+            'randles_cpe': (z_randles_cpe, ['Rs', 'Rct', 'Q', 'n'], [0, 0, 0, 0],
+                            [np.inf, np.inf, np.inf, 1])}
+
+def guess_circuit(f, Z, circuit='RC'):
+    '''
+    Starting values for fit_circuit from the high and low frequency limits of
+    Z' and the frequency of the peak in -Z''
+    '''
+    f = np.asarray(f)
+    hi = np.argmax(f)
+    lo = np.argmin(f)
+    
+    Rs = max(Z.real[hi], 1e-3 * np.abs(Z).max())
+    Rp = max(Z.real[lo] - Rs, Rs)
+    C = 1 / (2 * np.pi * f[np.argmax(-Z.imag)] * Rp)
+    
+    if circuit == 'RC':
+        return np.array([Rs, Rp, C])
+    
+    return np.array([Rs, Rp, C, 0.9])
+
+def fit_circuit(f, Z, circuit='RC', p0=None):
+    '''
+    Least-squares fit of an equivalent circuit to complex impedance, with the
+    analytic Jacobian of the circuit. Residuals are weighted by 1/|Z| so that
+    every frequency counts about equally
+    
+    f : array
+        Frequencies (Hz)
+    Z : array
+        Complex impedance, Z' - j(-Z'')
+    circuit : str, optional
+        A key of CIRCUITS, 'RC' (R(RC)) or 'randles_cpe'
+    p0 : array, optional
+        Starting values (default from guess_circuit)
+    
+    Returns
+    -------
+    popt : ndarray
+        Fit parameters, in the order of CIRCUITS[circuit][1]
+    redchi : float
+        Reduced chi-square of the weighted residuals
+    success : bool
+    '''
+    if circuit not in CIRCUITS:
+        raise ValueError('circuit must be one of ' + ', '.join(CIRCUITS))
+    
+    func, names, lower, upper = CIRCUITS[circuit]
+    f = np.asarray(f, dtype=float)
+    Z = np.asarray(Z, dtype=complex)
+    w = 1 / np.abs(Z)
+    
+    if p0 is None:
+        p0 = guess_circuit(f, Z, circuit)
+    
+    # least_squares needs starting values strictly inside the bounds
+    p0 = np.clip(p0, np.nextafter(lower, 1), np.nextafter(upper, 0))
+    
+    def residuals(p):
+        r = (func(f, *p)[0] - Z) * w
+        return np.concatenate([r.real, r.imag])
+    
+    def jacobian(p):
+        J = func(f, *p)[1] * w[:, None]
+        return np.concatenate([J.real, J.imag])
+    
+    res = least_squares(residuals, p0, jac=jacobian, bounds=(lower, upper), x_scale='jac')
+    redchi = 2 * res.cost / max(2 * len(f) - len(p0), 1)
+    
+    return res.x, redchi, res.success
+
+def _fit_band(freqs, Zs, circuit):
+    '''
+    fit_circuit to each (f, Z) in order. Each is started from the previous
+    result and from its own guess, keeping the better fit
+    
+    Returns a list of (popt, redchi, success), popt all nan for fits that failed
+    '''
+    fits = []
+    prev = None
+    
+    for f, Z in zip(freqs, Zs):
+        
+        best = (np.full(len(CIRCUITS[circuit][1]), np.nan), np.inf, False)
+        starts = [None] if prev is None else [prev, None]
+        
+        for start in starts:
+            try:
+                fit = fit_circuit(f, Z, circuit, p0=start)
+            except (ValueError, np.linalg.LinAlgError):
+                continue
+            
+            if fit[1] < best[1]:
+                best = fit
+        
+        fits.append(best)
+        prev = best[0] if np.isfinite(best[1]) else None
+    
+    return fits
+
+def fit_biases(edv, circuit='RC', volume=None, workers=None):
+    '''
+    Fits an equivalent circuit to every bias of read_eis data
+    
+    Biases are fit in order of voltage, each started from the neighbouring
+    bias's result (and from its own guess, keeping the better fit)
+    
+    edv : dict or DataFrame
+        From read_eis (either the dict or stacked=True)
+    circuit : str, optional
+        'RC' for R(RC) or 'randles_cpe' for a Randles circuit with a CPE
+    volume : float, optional
+        Volume of the film (cm^3), e.g. W * L * d of the channel, to scale the
+        capacitance to volumetric capacitance C*
+    workers : int, optional
+        Number of processes to fit with; each takes a contiguous range of
+        biases. None (default) or 1 fits them all in this process
+    
+    Returns
+    -------
+    fits : DataFrame
+        Indexed by bias (V), with the circuit parameters, the capacitance
+        C (F) (for a CPE, the effective capacitance from Brug's formula),
+        C* (F/cm^3) if volume is given, redchi and success
+    '''
+    if circuit not in CIRCUITS:
+        raise ValueError('circuit must be one of ' + ', '.join(CIRCUITS))
+    
+    if isinstance(edv, pd.DataFrame):
+        edv = {v: edv.loc[v] for v in edv.index.unique(level=0)}
+    
+    volts = sorted(edv)
+    freqs = [edv[v]['Frequency (Hz)'].values for v in volts]
+    Zs = [edv[v]["Z' (Ω)"].values - 1j * edv[v]["-Z'' (Ω)"].values for v in volts]
+    
+    if workers and workers > 1:
+        
+        bands = np.array_split(np.arange(len(volts)), workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_fit_band, [freqs[b] for b in band], [Zs[b] for b in band], circuit)
+                       for band in bands if len(band)]
+            fits = [fit for future in futures for fit in future.result()]
+    
+    else:
+        
+        fits = _fit_band(freqs, Zs, circuit)
+    
+    names = CIRCUITS[circuit][1]
+    df = pd.DataFrame([fit[0] for fit in fits], index=pd.Index(volts, name='Bias (V)'), columns=names)
+    
+    if circuit == 'RC':
+        df['C (F)'] = df['C']
+    else:
+        df['C (F)'] = (df['Q'] * (1 / df['Rs'] + 1 / df['Rct'])**(df['n'] - 1))**(1 / df['n'])
+    
+    if volume:
+        df['C* (F/cm^3)'] = df['C (F)'] / volume
+    
+    df['redchi'] = [fit[1] for fit in fits]
+    df['success'] = [fit[2] for fit in fits]
+    
+    return df
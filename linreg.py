@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Closed-form straight-line least-squares fits
+
+These replace curve_fit for y = intercept + slope * x, so no iterative optimizer
+is needed. window_fits does the fits for many windows y[:m] of the same data at
+once from running sums (used for threshold voltages).
+
+Usage:
+
+    >> slope, intercept, ssr, se_slope, se_intercept = linreg.line_fit(x, y)
+    >> slope, _, _, _, _ = linreg.line_fit(x, y, intercept=False)  # y = slope * x
+
+"""
+
+import numpy as np
+
+
+def line_fit(x, y, intercept=True, max_slope=None):
+    '''
+    Least-squares line fit of y vs x
+
+    x, y : array
+        Data to fit
+    intercept : bool, optional
+        False fits a line through the origin (intercept is then 0)
+    max_slope : float, optional
+        Upper bound on the slope (e.g. 0, as with bounds=([-inf, -inf], [0, inf]))
+
+    Returns
+    -------
+    slope, intercept : float
+    ssr : float
+        Sum of squared residuals
+    se_slope, se_intercept : float
+        Standard errors of the slope and intercept (nan if not enough points)
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    if not intercept:
+
+        sxx = np.sum(x * x)
+        slope = np.sum(x * y) / sxx
+        if max_slope is not None and slope > max_slope:
+            slope = max_slope
+
+        ssr = np.sum((y - slope * x) ** 2)
+        dof = len(x) - 1
+        se_slope = np.sqrt(ssr / dof / sxx) if dof > 0 else np.nan
+
+        return slope, 0.0, ssr, se_slope, 0.0
+
+    sums = running_sums(x, y)
+    m = np.array([len(x)])
+    slope, icpt, ssr, se_slope, se_icpt = window_fits(sums, m, max_slope=max_slope)
+
+    return slope[0], icpt[0], ssr[0], se_slope[0], se_icpt[0]
+
+
+def running_sums(x, y):
+    '''
+    Running sums of 1, x, y, x**2, x*y and y**2, each starting at 0
+
+    Element m of each is the sum over x[:m], y[:m]
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    sums = [np.concatenate(([0], np.cumsum(s))) for s in [x, y, x * x, x * y, y * y]]
+
+    return [np.arange(len(x) + 1, dtype=float)] + sums
+
+
+def window_fits(sums, stops, max_slope=None):
+    '''
+    Line fits to x[:m], y[:m] for every m in stops, all at once
+
+    sums : list of ndarray
+        From running_sums(x, y)
+    stops : array of int
+        End (exclusive) of each window, each at least 2
+    max_slope : float, optional
+        Upper bound on the slope. Windows whose best slope is above it are
+        fit with slope = max_slope instead
+
+    Returns
+    -------
+    slope, intercept, ssr, se_slope, se_intercept : ndarray
+        One element per window
+    '''
+    S1, Sx, Sy, Sxx, Sxy, Syy = sums
+    m = np.asarray(stops)
+    n = S1[m]
+
+    sxx = Sxx[m] - Sx[m] ** 2 / n
+    slope = (Sxy[m] - Sx[m] * Sy[m] / n) / sxx
+
+    if max_slope is not None:
+        slope = np.minimum(slope, max_slope)
+
+    icpt = (Sy[m] - slope * Sx[m]) / n
+    ssr = residuals(sums, slope, icpt, m)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s2 = np.where(n > 2, ssr / (n - 2), np.nan)
+        se_slope = np.sqrt(s2 / sxx)
+        se_icpt = np.sqrt(s2 * Sxx[m] / (n * sxx))
+
+    return slope, icpt, ssr, se_slope, se_icpt
+
+
+def residuals(sums, slope, intercept, stops):
+    '''
+    Sum of squared residuals of lines (slope, intercept) over x[:m], y[:m]
+    for every m in stops
+
+    sums : list of ndarray
+        From running_sums(x, y)
+    '''
+    S1, Sx, Sy, Sxx, Sxy, Syy = sums
+    m = np.asarray(stops)
+
+    ssr = (Syy[m] - 2 * slope * Sxy[m] - 2 * intercept * Sy[m]
+           + slope ** 2 * Sxx[m] + 2 * slope * intercept * Sx[m] + intercept ** 2 * S1[m])
+
+    # rounding can leave tiny negative values for (near) perfect fits
+    return np.maximum(ssr, 0)
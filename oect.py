@@ -10,6 +10,7 @@ __email__ = "rgiri@uw.edu"
 """
 
 import configparser
+import io
 import os
 import warnings
 
@@ -17,10 +18,11 @@ import numpy as np
 import pandas as pd
 from scipy import interpolate as spi
 from scipy import signal as sps
-from scipy.optimize import curve_fit as cf
 from collections import Counter
 
-from deriv import gm_deriv
+import linreg
+import profiling
+from deriv import gm_deriv, gm_deriv_batch
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
@@ -76,6 +78,10 @@ class OECT:
 			'sg' = Savitsky_golay smoothed derivative
 			'raw' = raw derivative
 			'poly' = 8th order polynomial fit
+		vt_method : str
+			For finding the threshold voltage from sqrt(Id)-Vg
+			'cwt' = spline + CWT peak-finding of inflections, fit each with curve_fit
+			'linear' = inflections from the raw 2nd difference, closed-form line fits
 
 	Attributes
 	----------
@@ -137,6 +143,7 @@ class OECT:
 			Voltage where the Id trace starts reverse sweep
 	'''
 
+	@profiling.stage('OECT.__init__')
 	def __init__(self, folder='', dimDict={}, params={}, options={}):
 
 		# Data containers
@@ -233,6 +240,8 @@ class OECT:
 		# defaults
 		if 'gm_method' not in self.options:
 			self.options['gm_method'] = 'sg'
+		if 'vt_method' not in self.options:
+			self.options['vt_method'] = 'cwt'
 		if 'Reverse' not in self.options:
 			self.options['Reverse'] = True
 		if 'Average' not in self.options:
@@ -244,6 +253,7 @@ class OECT:
 
 		return
 
+	@profiling.stage('OECT.loaddata')
 	def loaddata(self):
 		"""
 		3 Steps to loading a folder of data:
@@ -255,13 +265,15 @@ class OECT:
 
 		for t in self.files:
 
-			self.get_metadata(t)
+			# one pass over the file for both the header metadata and the data
+			data, meta = read_datafile(t)
+			self._set_metadata(meta)
 
 			if 'transfer' in t:
-				self.transfer_curve(t)
+				self.transfer_curve(t, data)
 
 			elif 'output' in t:
-				self.output_curve(t)
+				self.output_curve(t, data)
 
 		self.all_outputs()
 
@@ -314,23 +326,28 @@ class OECT:
 		""" Called in load_data to extract file-specific parameters """
 
 		# search params in first file in this folder for missing params
-		h = open(fl)
-		for line in h:
-			if 'V_DS = ' in line:
-				self.Vd = float(line.split()[-1])
-			if 'V_G = ' in line:
-				self.Vg = float(line.split()[-1])
+		_, meta = read_datafile(fl)
+		self._set_metadata(meta)
+
+		return
 
-			# if no config file found, populate based on the raw data
-			if 'Width/um' in line and (self.make_config or self.options['overwrite']):
-				self.W = float(line.split()[-1])
-			if 'Length/um' in line and (self.make_config or self.options['overwrite']):
-				self.L = float(line.split()[-1])
+	def _set_metadata(self, meta):
+		""" Sets Vd, Vg (and W, L if no config) from the metadata of read_datafile """
 
-		h.close()
+		if 'V_DS' in meta:
+			self.Vd = meta['V_DS']
+		if 'V_G' in meta:
+			self.Vg = meta['V_G']
+
+		# if no config file found, populate based on the raw data
+		if 'Width/um' in meta and (self.make_config or self.options['overwrite']):
+			self.W = meta['Width/um']
+		if 'Length/um' in meta and (self.make_config or self.options['overwrite']):
+			self.L = meta['Length/um']
 
 		return
 
+	@profiling.stage('OECT._reverse')
 	def _reverse(self, v, transfer=False):
 		"""if reverse trace exists, return inflection-point index and flag
 		
@@ -385,57 +402,134 @@ class OECT:
 
 			return mx, False
 
+	@profiling.stage('OECT.calc_gms')
 	def calc_gms(self):
 		"""
 		Calculates all the gms in the set of data.
 		Assigns each one to gm_fwd (forward) and gm_bwd (reverse) as a dict
 
 		Creates a single dataFrame gms_fwd and another gms_bwd
+
+		All sweeps on the same voltages are differentiated together in one call
+		(see _batch_gm); _calc_gm does the same for a single transfer curve
 		"""
 
-		for i in self.transfer:
-			self.gm_fwd[i], self.gm_bwd[i], self.gm_peaks = self._calc_gm(self.transfer[i])
+		mx, reverse = self.rev_point, self.reverse
 
-		# combine all the gm_fwd and gm_bwd into a single dataframe
-		labels = 0
+		# split every transfer curve into its forward and (flipped) backward sweep
+		sweeps = []
+		for tf in self.transfer:
 
-		for g in self.gm_fwd:
+			v = np.array(self.transfer[tf].index)
+			i = np.array(self.transfer[tf].values)[:, 0]
 
-			if not self.gm_fwd[g].empty:
+			sweeps.append((tf, 'fwd', v[:mx], i[:mx]))
+			if reverse:
+				sweeps.append((tf, 'bwd', np.flip(v[mx:]), np.flip(i[mx:])))
 
-				gm = self.gm_fwd[g].values.flatten()
-				idx = self.gm_fwd[g].index.values
+		gm = self._batch_gm([s[2] for s in sweeps], [s[3] for s in sweeps])
 
-				nm = 'gm_' + g
+		for tf in self.transfer:
+			self.gm_bwd[tf] = pd.DataFrame()  # empty dataframe, if no reverse trace
 
-				while nm in self.gms:
-					labels += 1
-					nm = 'gm_' + g[:-1] + str(labels)
+		for (tf, direction, v, _), g in zip(sweeps, gm):
 
-				df = pd.Series(data=gm, index=idx)
-				df.sort_index(inplace=True)
-				self.gms[nm] = df
+			df = pd.DataFrame(data=g, index=v, columns=['gm'])
+			df.index.name = 'Voltage (V)'
 
-		for g in self.gm_bwd:
+			if direction == 'fwd':
+				self.gm_fwd[tf] = df
+			else:
+				self.gm_bwd[tf] = df
 
-			if not self.gm_bwd[g].empty:
+		# peak gm of each sweep (kept for the last transfer curve, as in _calc_gm)
+		for tf in self.transfer:
 
-				gm = self.gm_bwd[g].values.flatten()
-				idx = self.gm_bwd[g].index.values
+			peaks = [self.gm_fwd[tf]]
+			if not self.gm_bwd[tf].empty:
+				peaks.append(self.gm_bwd[tf])
 
-				nm = 'gm_' + g
+			gm_peaks = np.array([np.max(p.values) for p in peaks])
+			gm_args = np.array([p.index[np.argmax(p.values)] for p in peaks])
+			self.gm_peaks = pd.DataFrame(data=gm_peaks, index=gm_args, columns=['peak gm (S)'])
 
-				while nm in self.gms:
-					labels += 1
-					nm = 'gm_' + g[:-1] + str(labels)
+		# combine all the gm_fwd and gm_bwd into a single dataframe
+		labels = 0
+		names = set(self.gms.columns)
+		columns = {}
 
-				df = pd.Series(data=gm, index=idx)
-				df.sort_index(inplace=True)
-				self.gms[nm] = df
+		for gms in [self.gm_fwd, self.gm_bwd]:
+
+			for g in gms:
+
+				if not gms[g].empty:
+
+					nm = 'gm_' + g
+
+					while nm in names:
+						labels += 1
+						nm = 'gm_' + g[:-1] + str(labels)
+
+					names.add(nm)
+					df = pd.Series(data=gms[g].values.flatten(), index=gms[g].index.values)
+					columns[nm] = df.sort_index()
+
+		if columns:
+
+			# all columns are aligned to the first sweep, as when added one at a time
+			if self.gms.empty:
+				index = next(iter(columns.values())).index
+				self.gms = pd.DataFrame(columns, index=index)
+			else:
+				self.gms = pd.concat([self.gms, pd.DataFrame(columns, index=self.gms.index)], axis=1)
 
 		self.peak_gm = self.gm_peaks['peak gm (S)'].values
 		return
 
+	def _batch_gm(self, v, i):
+		"""
+		Calculates gm for many sweeps at once
+
+		Sweeps that share the same voltages are stacked as columns of one 2-D
+		array and differentiated in a single gm_deriv_batch call.
+
+		v : list of ndarray
+			voltages of each sweep
+		i : list of ndarray
+			currents of each sweep
+
+		Returns
+		-------
+		gm : list of ndarray
+			gm for each sweep, in the order passed
+		"""
+
+		# sg parameters
+		window = np.max([int(0.04 * self.transfers.shape[0]), 3])
+		polyorder = 2
+		deg = 8
+		fitparams = {'window': window, 'polyorder': polyorder, 'deg': deg}
+
+		groups = {}
+		for n, vx in enumerate(v):
+			groups.setdefault((len(vx), vx.tobytes()), []).append(n)
+
+		gm = [None] * len(v)
+		for members in groups.values():
+
+			stack = np.empty((len(v[members[0]]), len(members)))
+			for col, n in enumerate(members):
+				stack[:, col] = i[n]
+
+			gml = gm_deriv_batch(v[members[0]], stack, self.options['gm_method'], fitparams)
+			if gml is None:  # bad gm_method
+				gml = np.full(stack.shape, np.nan)
+
+			for col, n in enumerate(members):
+				gm[n] = gml[:, col]
+
+		return gm
+
 	def _calc_gm(self, df):
 		"""
 		Calculates single gm curve in milli-Siemens
@@ -493,19 +587,20 @@ class OECT:
 		print(gm_peaks)
 		return gm_fwd, gm_bwd, gm_peaks
 
-	def output_curve(self, path):
-		"""Loads Id-Vd output curves from a folder as Series in a list"""
+	def output_curve(self, path, data=None):
+		"""
+		Loads Id-Vd output curves from a folder as Series in a list
+
+		data : DataFrame, optional
+			The numeric block already parsed by read_datafile. Read from path if None
+		"""
 
 		V = self.Vg
 
-		op = pd.read_csv(path, delimiter='\t', engine='python')
+		if data is None:
+			data, _ = read_datafile(path)
 
-		# Remove junk rows
-		_junk = pd.to_numeric(op['V_DS'], errors='coerce')
-		_junk = _junk.notnull()
-		op = op.loc[_junk]
-		op = op.set_index('V_DS')
-		op = op.set_index(pd.to_numeric(op.index.values))
+		op = _index_by(data, 'V_DS')
 
 		mx, reverse = self._reverse(op.index.values, transfer=False)
 		idx = op.index.values[mx]
@@ -529,32 +624,63 @@ class OECT:
 		"""
 		Creates a single dataFrame with all output curves
 		This assumes that all data were taken at the same Vds range
+
+		The voltages of all the curves are combined once and the values are
+		placed into one preallocated array, rather than concatenating each curve
 		"""
 		self.Vg_labels = []  # corrects for labels below
 
+		curves = []
+		names = []
+
+		if not self.outputs.empty:
+			curves.append(self.outputs)
+			names += list(self.outputs.columns)
+
 		for op in self.output:
 			self.Vg_labels.append(op)
-			df = pd.DataFrame(self.output[op])
-			df = df.rename(columns={self.output[op].columns[0]: op})
+			curves.append(self.output[op])
+			names += [op] + list(self.output[op].columns[1:])
 
-			if self.outputs.empty:
-				self.outputs = pd.DataFrame(df)
-			else:
-				self.outputs = pd.concat([self.outputs, df], axis=1)
+		if not curves:
+			return
+
+		# union of all the voltages, in the same order as pd.concat
+		grid = curves[0].index
+		for df in curves[1:]:
+			if not grid.equals(df.index):
+				grid = grid.union(df.index, sort=False)
+
+		values = np.full((len(grid), len(names)), np.nan)
+
+		if grid.is_unique and all(df.index.is_unique for df in curves):
+
+			col = 0
+			for df in curves:
+				values[grid.get_indexer(df.index), col:col + df.shape[1]] = df.values
+				col += df.shape[1]
+
+			self.outputs = pd.DataFrame(values, index=grid, columns=names)
+
+		else:  # repeated voltages can't be placed by position, let pandas align
+
+			self.outputs = pd.concat([pd.DataFrame(df.values, index=df.index) for df in curves], axis=1)
+			self.outputs.columns = names
 
 		self.num_outputs = len(self.outputs.columns)
 		return
 
-	def transfer_curve(self, path):
-		"""Loads Id-Vg transfer curve from a path"""
-		transfer_raw = pd.read_csv(path, delimiter='\t', engine='python')
+	def transfer_curve(self, path, data=None):
+		"""
+		Loads Id-Vg transfer curve from a path
+
+		data : DataFrame, optional
+			The numeric block already parsed by read_datafile. Read from path if None
+		"""
+		if data is None:
+			data, _ = read_datafile(path)
 
-		# Remove junk rows
-		_junk = pd.to_numeric(transfer_raw['V_G'], errors='coerce')
-		_junk = _junk.notnull()
-		transfer_raw = transfer_raw.loc[_junk]
-		transfer_raw = transfer_raw.set_index('V_G')
-		transfer_raw = transfer_raw.set_index(pd.to_numeric(transfer_raw.index.values))
+		transfer_raw = _index_by(data, 'V_G')
 
 		transfer_Vd = str(self.Vd)
 
@@ -578,7 +704,13 @@ class OECT:
 		"""
 		Creates a single dataFrame with all transfer curves (in case more than 1)
 		This assumes that all data were taken at the same Vgs range
+
+		Each sweep is aligned to the voltages of the first sweep, and all are
+		placed into one preallocated array
 		"""
+		names = []
+		sweeps = []
+
 		for tf in self.transfer:
 			self.Vd_labels.append(tf)
 
@@ -586,16 +718,33 @@ class OECT:
 			idx = self.transfer[tf]['I_DS (A)'].index.values
 
 			mx, reverse = self._reverse(idx, transfer=True)
-			nm = tf + '_01'
-			df = pd.Series(data=transfer[:mx], index=idx[:mx])
-			df.sort_index(inplace=True)
-			self.transfers[nm] = df
+			names.append(tf + '_01')
+			sweeps.append((idx[:mx], transfer[:mx]))
 
 			if reverse:
-				nm = tf + '_02'
-				df = pd.Series(data=transfer[mx:], index=idx[mx:])
-				df.sort_index(inplace=True)
-				self.transfers[nm] = df
+				names.append(tf + '_02')
+				sweeps.append((idx[mx:], transfer[mx:]))
+
+		if sweeps:
+
+			# sorted by voltage
+			sweeps = [(v[np.argsort(v)], i[np.argsort(v)]) for v, i in sweeps]
+
+			if self.transfers.empty:
+				grid = pd.Index(sweeps[0][0])
+			else:
+				grid = self.transfers.index
+
+			values = np.full((len(grid), len(sweeps)), np.nan)
+			for col, (v, i) in enumerate(sweeps):
+				pos = pd.Index(v).get_indexer(grid)  # raises if v has repeats, as before
+				values[pos >= 0, col] = i[pos[pos >= 0]]
+
+			if self.transfers.empty:
+				self.transfers = pd.DataFrame(values, index=grid, columns=names)
+			else:
+				for col, nm in enumerate(names):
+					self.transfers[nm] = values[:, col]
 
 		if 'Average' in self.options and self.options['Average']:
 			self.transfers = self.transfers.mean(1)
@@ -634,6 +783,7 @@ class OECT:
 
 		return
 
+	@profiling.stage('OECT.thresh')
 	def thresh(self, plot=False):
 		"""
 		Finds the threshold voltage by fitting sqrt(Id) vs (Vg-Vt) and finding
@@ -662,7 +812,10 @@ class OECT:
 			Id_lo = np.sqrt(np.abs(self.transfers[tf]).values)
 
 			# minimize residuals by finding right peak
-			fit = self._min_fit(Id_lo - np.min(Id_lo), v_lo)
+			if self.options['vt_method'] == 'linear':
+				fit = self._min_fit_linear(Id_lo - np.min(Id_lo), v_lo)
+			else:
+				fit = self._min_fit(Id_lo - np.min(Id_lo), v_lo)
 
 			if plot:
 				plt.plot(np.sqrt(np.abs(self.transfers[tf])), 'bo-')
@@ -720,14 +873,21 @@ class OECT:
 		for m in mx_d2:
 			# Id = Id - np.min(Id) # 0-offset
 
-			fit, _ = cf(self.line_f, V[:m], Id[:m],
-						bounds=([-np.inf, -np.inf], [0, np.inf]))
+			slope, icpt, _, _, _ = linreg.line_fit(V[:m], Id[:m])
+
+			# slope must be negative; clamping it to 0 would put Vt at -inf
+			if slope >= 0:
+				continue
+			fit = np.array([slope, icpt])
 
 			v_x = np.searchsorted(V, -fit[1] / fit[0])  # finds the Vt from this fit to determine residual
 			_res = np.sum(np.array((Id[:v_x] - self.line_f(V[:v_x], fit[0], fit[1])) ** 2))
 			_fits = np.vstack((_fits, fit))
 			_residuals = np.append(_residuals, _res)
 
+		if not len(_residuals):
+			return np.array([np.nan, np.nan])
+
 		_fits = _fits[1:, :]
 		fit = _fits[np.argmin(_residuals), :]
 
@@ -736,6 +896,45 @@ class OECT:
 
 		return fit
 
+	# same as _min_fit, but without splines, CWT or iterative fitting
+	def _min_fit_linear(self, Id, V):
+
+		# splines needs to be ascending
+		if V[2] < V[1]:
+			V = np.flip(V)
+			Id = np.flip(Id)
+
+		self.quadrant()
+
+		if self.quad == 'I':  # top right
+
+			Id = np.flip(Id)
+			V = np.flip(-V)
+
+		mx_d2 = self._find_inflection(Id, V)
+
+		# line fits to Id[:m] for all candidates m at once, from running sums
+		sums = linreg.running_sums(V, Id)
+		slope, icpt, _, _, _ = linreg.window_fits(sums, mx_d2)
+
+		# slope must be negative, as in _min_fit
+		keep = slope < 0
+		if not np.any(keep):
+			return np.array([np.nan, np.nan])
+		slope, icpt = slope[keep], icpt[keep]
+
+		# residual up to the Vt found from each fit
+		v_x = np.searchsorted(V, -icpt / slope)
+		_residuals = linreg.residuals(sums, slope, icpt, v_x)
+
+		best = np.argmin(_residuals)
+		fit = np.array([slope[best], icpt[best]])
+
+		if self.quad == 'I':
+			fit[0] *= -1
+
+		return fit
+
 	# linear curve-fitting
 	@staticmethod
 	def line_f(x, f0, f1):
@@ -743,6 +942,7 @@ class OECT:
 		return f1 + f0 * x
 
 	@staticmethod
+	@profiling.stage('OECT._find_peak')
 	def _find_peak(I, V, negative_Vt=True, width=15):
 		"""
 		Uses spline to find the transition point then return it for fitting Vt
@@ -779,6 +979,36 @@ class OECT:
 
 		return mx_d2
 
+	@staticmethod
+	def _find_inflection(I, V):
+		"""
+		Finds candidate transition points for fitting Vt to sqrt(Id) vs Vg from
+		the local maxima of the raw second difference, plus their neighbours.
+		Falls back to every point if none are found.
+
+		Parameters
+		----------
+		I : array
+			Id vs Vg, currents
+		V : array
+			Id vs Vg, voltages
+
+		Returns
+		-------
+		mx_d2 : ndarray
+			indices of the candidate transition points, at least 3
+		"""
+
+		d2 = np.gradient(np.gradient(I))
+		peaks = sps.find_peaks(d2)[0]
+
+		mx_d2 = np.unique(np.clip(np.concatenate((peaks - 1, peaks, peaks + 1)), 3, len(V)))
+
+		if not mx_d2.size:
+			mx_d2 = np.arange(3, len(V) + 1)
+
+		return mx_d2
+
 	def update_config(self):
 
 		config = configparser.ConfigParser()
@@ -809,6 +1039,88 @@ class OECT:
 		return
 
 
+def read_datafile(path):
+	"""
+	Reads a single transfer or output .txt file in one pass.
+
+	The files are a tab-delimited numeric block (with a header row) followed by
+	a blank row and then the metadata, e.g. "V_DS = 	-0.600	". The numeric
+	block is handed to the C parser and the metadata lines are split off as
+	they are read, so the file is only opened once.
+
+	Parameters
+	----------
+	path : str
+		Path to the .txt file
+
+	Returns
+	-------
+	data : DataFrame
+		The numeric block, columns from the header row (e.g. V_G, I_DS (A), ...)
+	meta : dict
+		Metadata values by name, e.g. {'V_DS': -0.6, 'Width/um': 4000.0}
+	"""
+	meta = {}
+
+	with open(path) as h:
+
+		header = h.readline()
+		block = [header]
+
+		for line in h:
+
+			# the numeric block ends at the first blank or "key = value" row
+			if not line.strip('\t\r\n ') or '=' in line:
+
+				_parse_metadata(line, meta)
+				break
+
+			block.append(line)
+
+		for line in h:
+			_parse_metadata(line, meta)
+
+	data = pd.read_csv(io.StringIO(''.join(block)), delimiter='\t', engine='c')
+
+	return data, meta
+
+
+def _parse_metadata(line, meta):
+	""" Adds a "key = value" line from the end of a data file to meta """
+
+	if '=' not in line:
+		return
+
+	key, _, val = line.partition('=')
+	val = val.split()
+
+	try:
+		meta[key.strip()] = float(val[-1])
+	except (IndexError, ValueError):
+		pass
+
+	return
+
+
+def _index_by(data, col):
+	"""
+	Sets the voltage column col as a numeric index, dropping any junk rows.
+	Raises KeyError if col is not in the file
+	"""
+	v = data[col]
+
+	# Remove junk rows; only needed if the C parser could not make it numeric
+	if v.dtype == object:
+		v = pd.to_numeric(v, errors='coerce')
+		data = data.loc[v.notnull()]
+		v = v.loc[v.notnull()]
+
+	data = data.drop(columns=col)
+	data.index = pd.Index(v.values.astype(float))
+
+	return data
+
+
 def config_file(cfg):
 	"""
 	Generates parameters from supplied config file
@@ -822,7 +1134,7 @@ def config_file(cfg):
 	vgs_keys = ['Preread (ms)', 'First Bias (ms)', 'Vds (V)']
 	vds_keys = ['Preread (ms)', 'First Bias (ms)', 'Output Vgs']
 	opts_bools = ['Reverse', 'Average']
-	opts_str = ['gm_method']
+	opts_str = ['gm_method', 'vt_method']
 	opts_flt = ['V_low']
 
 	for key in dim_keys:
@@ -5,14 +5,20 @@ Created on Thu Aug 23 11:04:47 2018
 @author: Raj
 """
 
+import copy
+import hashlib
 import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-from scipy.optimize import curve_fit as cf
 
+import linreg
 import oect
 import oect_plot
+import profiling
 import matplotlib as plt
 from collections import Counter
 
@@ -27,9 +33,15 @@ Usage:
 	
 '''
 
+# processed pixels are cached in this file in each pixel folder (cache=True)
+CACHE_FILE = '.oect_cache'
+CACHE_VERSION = 1  # bump when the processing changes so old caches are ignored
 
+
+@profiling.stage('oect_load.uC_scale')
 def uC_scale(paths, average_devices=False, dimDict={}, thickness=40e-9, plot=[True, False], V_low=False,
-			 retrace_only=False, verbose=True, options={}, pg_graphs=[None, None], dot_color='r', text_browser=None):
+			 retrace_only=False, verbose=True, options={}, pg_graphs=[None, None], dot_color='r', text_browser=None,
+			 workers=None, cache=False, callback=None):
 	'''
 	paths: array
 		contains subfolders to plot
@@ -68,6 +80,19 @@ def uC_scale(paths, average_devices=False, dimDict={}, thickness=40e-9, plot=[Tr
 	text_browser: QTextBrowser
 		UI text browser dispaying information
 
+	workers : int, optional
+		Number of processes to load the pixels with. None (default) or 1 loads
+		them one at a time in this process. Pixels are returned in the same order
+		either way. On Windows, scripts using this need an
+		if __name__ == '__main__': guard
+
+	cache : bool, optional
+		Reuse/save each processed pixel in its folder, see loadOECT
+
+	callback : function, optional
+		Called as callback(path, device) as each pixel finishes, in order.
+		Raising an exception in it stops the run (e.g. to cancel from a UI)
+
 	Returns
 	-------
 	pixels : dict of OECT
@@ -101,21 +126,86 @@ def uC_scale(paths, average_devices=False, dimDict={}, thickness=40e-9, plot=[Tr
 	if type(plot) == bool or len(plot) == 1:
 		plot = [plot, plot]
 
+	jobs = []
 	for p, f in zip(paths, pixkeys):
 
 		if os.listdir(p):
+			jobs.append((p, f))
+		else:
+
+			pixkeys.remove(f)
+
+	if workers and workers > 1:
+
+		# each pixel is independent; results are collected in submission order
+		with ProcessPoolExecutor(max_workers=workers) as executor:
+			futures = [executor.submit(loadOECT, p, dimDict, {'d': thickness}, gm_plot=plot,
+									   plot=plot[1], options=opts, verbose=False, cache=cache)
+					   for p, _ in jobs]
+
+			for (p, f), future in zip(jobs, futures):
+
+				dv = future.result()
+				if verbose:
+					print(p)
+					if text_browser:
+						text_browser.append(p)
+					_print_gms(dv, text_browser)
+				pixels[f] = dv
+				if callback:
+					callback(p, dv)
+
+	else:
+
+		for p, f in jobs:
 
 			if verbose:
 				print(p)
 				if text_browser:
 					text_browser.append(p)
 			dv = loadOECT(p, dimDict, {'d': thickness}, gm_plot=plot, plot=plot[1],
-						  options=opts, verbose=verbose, text_browser=text_browser)
+						  options=opts, verbose=verbose, text_browser=text_browser, cache=cache)
 			pixels[f] = dv
-		else:
+			if callback:
+				callback(p, dv)
+
+	if average_devices:
+		pixels = average_same_widths(pixels)
+
+	uC_dv = _uC_fit(pixels, os.path.dirname(paths[0]), retrace_only)
+	uC_0 = uC_dv['uC_0']
+
+	if plot[0]:
+		fig = oect_plot.plot_uC(uC_dv, pg_graphs, dot_color=dot_color)
+
+		if verbose:
+			if text_browser:
+				text_browser.append('uC* = ' + str(uC_0 * 1e-2) + ' F/cm*V*s')
+			print('uC* = ', str(uC_0 * 1e-2), ' F/cm*V*s')
+
+	if verbose:
+		print('Vt = ', uC_dv['Vt'])
+		if text_browser:
+			text_browser.append('Vt = ' + str(uC_dv['Vt']))
+
+	return pixels, uC_dv
 
-			pixkeys.remove(f)
 
+def _uC_fit(pixels, folder, retrace_only=False):
+	'''
+	Fits uC* to the peak gm vs Wd/L * (Vg-Vt) of a set of processed pixels
+
+	pixels : dict of OECT
+	folder : str
+		Parent folder, stored in the returned dict
+	retrace_only : bool, optional
+		Only uses the retrace of each transfer curve
+
+	Returns
+	-------
+	uC_dv : dict
+		see uC_scale
+	'''
 	# do uC* graphs, need gm vs W*d/L
 	Wd_L = np.array([])
 	W = np.array([])
@@ -125,9 +215,6 @@ def uC_scale(paths, average_devices=False, dimDict={}, thickness=40e-9, plot=[Tr
 
 	# assumes Length and thickness are fixed
 	uC_dv = {}
-	
-	if average_devices:
-		pixels = average_same_widths(pixels)
 
 	for pixel in pixels:
 		if not pixels[pixel].gms.empty:
@@ -151,18 +238,12 @@ def uC_scale(paths, average_devices=False, dimDict={}, thickness=40e-9, plot=[Tr
 			uC_dv['L'] = pixels[pixel].L
 			uC_dv['d'] = pixels[pixel].d
 
-	# fit functions
-	def line_f(x, a, b):
-
-		return a + b * x
-
-	def line_0(x, b):
-		'no y-offset --> better log-log fits'
-		return b * x
-
+	# closed-form fits; uC_0 has no y-offset --> better log-log fits
 	# * 1e2 to get into right mobility units (cm)
-	uC_0, _ = cf(line_0, Wd_L * Vg_Vt, gms)
-	uC, _ = cf(line_f, Wd_L * Vg_Vt, gms)
+	slope, _, _, _, _ = linreg.line_fit(Wd_L * Vg_Vt, gms, intercept=False)
+	uC_0 = np.array([slope])
+	slope, icpt, _, _, _ = linreg.line_fit(Wd_L * Vg_Vt, gms)
+	uC = np.array([icpt, slope])
 
 	# Create an OECT and add arrays 
 	uC_dv['WdL'] = Wd_L
@@ -172,31 +253,161 @@ def uC_scale(paths, average_devices=False, dimDict={}, thickness=40e-9, plot=[Tr
 	uC_dv['uC'] = uC
 	uC_dv['uC_0'] = uC_0
 	uC_dv['gms'] = gms
-	uC_dv['folder'] = os.path.dirname(paths[0])
+	uC_dv['folder'] = folder
 
-	if plot[0]:
-		fig = oect_plot.plot_uC(uC_dv, pg_graphs, dot_color=dot_color)
+	return uC_dv
 
-		if verbose:
-			if text_browser:
-				text_browser.append('uC* = ' + str(uC_0 * 1e-2) + ' F/cm*V*s')
-			print('uC* = ', str(uC_0 * 1e-2), ' F/cm*V*s')
 
-	if verbose:
-		print('Vt = ', uC_dv['Vt'])
-		if text_browser:
-			text_browser.append('Vt = ' + str(uC_dv['Vt']))
+class UCWatcher:
+	'''
+	Watches a uC* folder while it is being measured and keeps the pixels and uC* fit
+	up to date, reprocessing only the pixel folders whose files were added or changed
 
-	return pixels, uC_dv
+	Folders are polled by file name, mtime and size (the files are not read), so a
+	poll with nothing new is cheap. A pixel that fails to load (e.g. a file is still
+	being written) keeps its last result and is retried on the next poll.
+
+	paths : str or list of str
+		Parent folder, whose subfolders (including ones created later) are the pixels,
+		or a fixed list of pixel subfolders as in uC_scale
+
+	The other parameters are as in uC_scale
+
+	Usage:
+
+		>> watcher = oect_load.UCWatcher(r'path_to_uC_scale', dimDict, thickness=40e-9)
+		>> changed = watcher.poll()  # processes everything the first time
+		>> watcher.uC_dv['uC_0']
+		>> watcher.watch(interval=10, callback=my_update)  # until Ctrl-C
+	'''
+
+	def __init__(self, paths, dimDict={}, thickness=40e-9, V_low=False, retrace_only=False,
+				 average_devices=False, options={}, cache=False):
+
+		self.paths = paths
+		self.dimDict = dimDict
+		self.thickness = thickness
+		self.retrace_only = retrace_only
+		self.average_devices = average_devices
+		self.cache = cache
 
+		self.options = {'V_low': V_low}
+		self.options.update(options)
 
+		self.pixels = {}  # same keys as uC_scale, in folder order
+		self.uC_dv = None
+		self.signatures = {}
 
-def loadOECT(path, dimDict, params=None, gm_plot=True, plot=True, options={}, verbose=True, text_browser=None):
+		return
+
+	def pixel_folders(self):
+		'''
+		Current list of non-empty pixel subfolders
+		'''
+		if isinstance(self.paths, str):
+			paths = [os.path.join(self.paths, f) for f in sorted(os.listdir(self.paths))]
+		else:
+			paths = self.paths
+
+		return [p for p in paths if os.path.isdir(p) and os.listdir(p)]
+
+	def poll(self):
+		'''
+		Reprocesses new or changed pixel folders and, if any changed, refits uC*
+
+		Returns
+		-------
+		changed : list of str
+			Pixel folders that were (re)processed or removed since the last poll
+		'''
+		paths = self.pixel_folders()
+		changed = []
+
+		for p in paths:
+
+			signature = _folder_signature(p, digest=False)
+			if self.signatures.get(p) == signature:
+				continue
+
+			try:
+				dv = loadOECT(p, self.dimDict, {'d': self.thickness}, plot=False,
+							  options=self.options, verbose=False, cache=self.cache)
+			except Exception as e:
+				print('Could not load', p, ':', e)
+				continue
+
+			# read again after processing in case the config file was (re)written
+			self.signatures[p] = _folder_signature(p, digest=False)
+			self.pixels[p + '_uC'] = dv
+			changed.append(p)
+
+		for p in list(self.signatures):
+			if p not in paths:
+				del self.signatures[p]
+				self.pixels.pop(p + '_uC', None)
+				changed.append(p)
+
+		if changed:
+			self.pixels = {p + '_uC': self.pixels[p + '_uC'] for p in paths if p + '_uC' in self.pixels}
+			self._fit(paths)
+
+		return changed
+
+	def _fit(self, paths):
+
+		pixels = self.pixels
+		if self.average_devices:
+			# averaging overwrites peak_gm/VgVts, so keep the processed pixels intact
+			pixels = average_same_widths({k: copy.copy(v) for k, v in pixels.items()})
+
+		if pixels:
+			self.uC_dv = _uC_fit(pixels, os.path.dirname(paths[0]), self.retrace_only)
+		else:
+			self.uC_dv = None
+
+		return
+
+	def watch(self, interval=5, callback=None, max_polls=None):
+		'''
+		Polls every interval seconds until interrupted (Ctrl-C) or max_polls is reached
+
+		callback : function, optional
+			Called as callback(changed, pixels, uC_dv) after each poll that changed something,
+			e.g. to update a plot
+		'''
+		polls = 0
+
+		try:
+			while max_polls is None or polls < max_polls:
+
+				changed = self.poll()
+				polls += 1
+				if changed and callback:
+					callback(changed, self.pixels, self.uC_dv)
+
+				if max_polls is None or polls < max_polls:
+					time.sleep(interval)
+
+		except KeyboardInterrupt:
+			pass
+
+		return self.pixels, self.uC_dv
+
+
+@profiling.stage('oect_load.loadOECT')
+def loadOECT(path, dimDict, params=None, gm_plot=True, plot=True, options={}, verbose=True, text_browser=None,
+			 cache=False):
 	"""
 	Wrapper function for processing OECT data
 
 	params = {W: , L: , d: } for W, L, d of device
 
+	cache : bool, optional
+		Saves the processed device to a .oect_cache file in the folder, and on later
+		calls returns that device instead of reprocessing. The cache is only used if
+		the .txt/.cfg files (mtime, size and content hash), params, options and
+		dimDict entry all match the ones it was made with
+
 	USAGE:
 		device1 = loadOECT(folder_name)
 	"""
@@ -204,20 +415,22 @@ def loadOECT(path, dimDict, params=None, gm_plot=True, plot=True, options={}, ve
 	if not path:
 		path = file_open(caption='Select device subfolder')
 
-	device = oect.OECT(path, dimDict, params, options)
-	device.calc_gms()
-	device.thresh()
+	device = None
+	if cache:
+		device = _read_cache(path, _cache_key(path, dimDict, params, options))
 
-	scaling = device.WdL  # W *d / L
+	if device is None:
 
-	if verbose:
-		for key in device.gms:
-			print(key, ': {:.2f}'.format(np.max(device.gms[key].values * 1e-2) / scaling), 'S/cm scaled')
-			print(key, ': {:.2f}'.format(np.max(device.gms[key].values * 1000)), 'mS max')
-			if (text_browser):
-				text_browser.append(key + str(': {:.2f}'.format(np.max(device.gms[key].values * 1e-2) / scaling)) + 'S/cm scaled')
-				text_browser.append(key + str(': {:.2f}'.format(np.max(device.gms[key].values * 1000))) + 'mS max')
+		device = oect.OECT(path, dimDict, params, options)
+		device.calc_gms()
+		device.thresh()
+
+		# the key is made after processing in case the config file was (re)written
+		if cache:
+			_write_cache(path, _cache_key(path, dimDict, params, options), device)
 
+	if verbose:
+		_print_gms(device, text_browser)
 
 
 	if plot:
@@ -232,6 +445,89 @@ def loadOECT(path, dimDict, params=None, gm_plot=True, plot=True, options={}, ve
 	return device
 
 
+def _folder_signature(path, digest=True):
+	'''
+	Returns (name, mtime, size, sha1) of each .txt and .cfg file in a pixel folder
+
+	digest : bool, optional
+		False skips reading the files and leaves out the sha1 (cheap enough to poll)
+	'''
+	signature = []
+
+	for name in sorted(os.listdir(path)):
+
+		if name[-3:] == 'txt' or name[-4:] == '.cfg':
+
+			fl = os.path.join(path, name)
+			stat = os.stat(fl)
+			entry = (name, stat.st_mtime_ns, stat.st_size)
+			if digest:
+				with open(fl, 'rb') as h:
+					entry += (hashlib.sha1(h.read()).hexdigest(),)
+
+			signature.append(entry)
+
+	return tuple(signature)
+
+
+def _cache_key(path, dimDict, params, options):
+	'''
+	Cache key for a pixel folder: its files plus everything passed to oect.OECT
+	'''
+	dims = None
+	if dimDict:
+		dims = dimDict.get(os.path.dirname(path), {}).get(os.path.basename(path))
+
+	return (CACHE_VERSION,
+			_folder_signature(path),
+			repr(sorted((params or {}).items())),
+			repr(sorted((options or {}).items())),
+			repr(dims))
+
+
+def _read_cache(path, key):
+	'''
+	Returns the cached OECT for this folder, or None if missing or stale
+	'''
+	try:
+		with open(os.path.join(path, CACHE_FILE), 'rb') as h:
+			entry = pickle.load(h)
+	except Exception:  # no cache, or unreadable (e.g. written by other versions)
+		return None
+
+	if entry.get('key') != key:
+		return None
+
+	return entry['device']
+
+
+def _write_cache(path, key, device):
+
+	try:
+		with open(os.path.join(path, CACHE_FILE), 'wb') as h:
+			pickle.dump({'key': key, 'device': device}, h, pickle.HIGHEST_PROTOCOL)
+	except OSError:
+		print('Could not write cache in', path)
+
+	return
+
+
+def _print_gms(device, text_browser=None):
+	'''
+	Prints the scaled and peak gm of each sweep in a processed device
+	'''
+	scaling = device.WdL  # W *d / L
+
+	for key in device.gms:
+		print(key, ': {:.2f}'.format(np.max(device.gms[key].values * 1e-2) / scaling), 'S/cm scaled')
+		print(key, ': {:.2f}'.format(np.max(device.gms[key].values * 1000)), 'mS max')
+		if (text_browser):
+			text_browser.append(key + str(': {:.2f}'.format(np.max(device.gms[key].values * 1e-2) / scaling)) + 'S/cm scaled')
+			text_browser.append(key + str(': {:.2f}'.format(np.max(device.gms[key].values * 1000))) + 'mS max')
+
+	return
+
+
 def file_open(caption='Select folder'):
 	'''
 	File dialog if path not given in load commands
@@ -282,7 +578,7 @@ def average_same_widths(pixels):
 	#this is sorted from most to least occurring
 	widthCounts = Counter(widths).most_common()  
 	
-	while widthCounts[0][1] > 1: #while we still have to deal with averaging more devices
+	while widthCounts and widthCounts[0][1] > 1: #while we still have to deal with averaging more devices
 		currentWidth = widthCounts[0][0]
 		devices = devicesByWidth[currentWidth]	
 		peak_gms = [] #list of gms of devices of same width
@@ -14,6 +14,7 @@ from matplotlib import pyplot as plt
 from matplotlib.ticker import AutoMinorLocator
 import pyqtgraph as pg
 import os
+import profiling
 warnings.filterwarnings("ignore", category=matplotlib.cbook.mplDeprecation)
 
 '''
@@ -36,6 +37,7 @@ The other plotting functions are mostly used in OECT_loading or in OECT itself
 '''
 
 
+@profiling.stage('oect_plot.plot_uC')
 def plot_uC(dv, pg_graphs=[None,None], label='', savefig=True, axlin=None, axlog=None,
             fit=True, dot_color='r', **kwargs):
     """
@@ -117,12 +119,7 @@ def plot_uC(dv, pg_graphs=[None,None], label='', savefig=True, axlin=None, axlog
 
     #plot on linear pg_graph
     if (pg_graphs[0]):
-        pg_graphs[0].setTitle('uC* = ' + str(uC_0 * 1e-2) + ' F/cm*V*s')
-        folder_name = os.path.basename(dv['folder'])
-        for i in range(len(Vg_Vt)): #ensure log plot won't throw error
-            if Vg_Vt[i] == 0: Vg_Vt[i] = 10e-10
-            if gms[i] == 0: gms[i] = 10e-10
-        pg_graphs[0].plot(np.abs(WdL * Vg_Vt) * 1e2, gms * 1000, pen=None, symbolBrush=dot_color, symbol='o', name=folder_name)
+        _plot_uC_pg(pg_graphs[0], dv, dot_color)
     
     axlin.set_xlabel('Wd/L * (Vg-Vt) (cm*V)')
     axlin.set_ylabel('gm (mS)')
@@ -168,12 +165,7 @@ def plot_uC(dv, pg_graphs=[None,None], label='', savefig=True, axlin=None, axlog
 
     #plot on log pg_graph
     if (pg_graphs[1]):
-        pg_graphs[1].setTitle('uC* = ' + str(uC_0 * 1e-2) + ' F/cm*V*s')
-        folder_name = os.path.basename(dv['folder'])
-        for i in range(len(Vg_Vt)): #ensure log plot won't through error
-            if Vg_Vt[i] == 0: Vg_Vt[i] = 10e-10
-            if gms[i] == 0: gms[i] = 10e-10
-        pg_graphs[1].plot(np.abs(WdL * Vg_Vt) * 1e2, gms * 1000, pen=None, symbolBrush=dot_color, symbol='o', name=folder_name)
+        _plot_uC_pg(pg_graphs[1], dv, dot_color)
     
     axlog.set_xlabel('Wd/L * (Vg-Vt) (cm*V)')
     axlog.set_ylabel('gm (mS)')
@@ -200,6 +192,23 @@ def plot_uC(dv, pg_graphs=[None,None], label='', savefig=True, axlin=None, axlog
     return [axlin, axlog]
 
 
+def _plot_uC_pg(pg_graph, dv, dot_color):
+
+    WdL = dv['WdL']
+    Vg_Vt = dv['Vg_Vt']
+    gms = dv['gms']
+
+    pg_graph.setTitle('uC* = ' + str(dv['uC_0'] * 1e-2) + ' F/cm*V*s')
+    folder_name = os.path.basename(dv['folder'])
+    for i in range(len(Vg_Vt)): #ensure log plot won't throw error
+        if Vg_Vt[i] == 0: Vg_Vt[i] = 10e-10
+        if gms[i] == 0: gms[i] = 10e-10
+    pg_graph.plot(np.abs(WdL * Vg_Vt) * 1e2, gms * 1000, pen=None, symbolBrush=dot_color, symbol='o', name=folder_name)
+
+    return
+
+
+@profiling.stage('oect_plot.plot_transfers_gm')
 def plot_transfers_gm(dv, gm_plot=True, leakage=False):
     ''' 
     For plotting transfer and gm on the same plot for one pixel
@@ -267,6 +276,7 @@ def plot_transfers_gm(dv, gm_plot=True, leakage=False):
     return fig
 
 
+@profiling.stage('oect_plot.plot_outputs')
 def plot_outputs(dv, leakage=False):
     '''
     dv : OECT class object
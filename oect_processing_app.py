@@ -7,6 +7,7 @@ import pyqtgraph as pg
 from oect import *
 from oect_plot import *
 from oect_load import *
+from oect_load import _print_gms
 import os
 pg.setConfigOption('background', 'w')
 pg.setConfigOption('foreground', 'k') 
@@ -31,6 +32,73 @@ class getExistingDirectories(QFileDialog):
 
 		self.exec()
 
+class AnalysisCancelled(Exception):
+	pass
+
+
+class AnalysisWorker(QObject):
+	'''
+	Runs uC_scale for each parent folder off the GUI thread.
+	Move to a QThread and connect its started signal to run().
+
+	Results are passed back through signals, so all plotting (including saving
+	the scaling_uC figures) and text output happens on the GUI thread.
+
+	allPaths: list of lists
+		selected subfolders of each parent folder
+	dimDict: dict
+		dictionary in format of {parentfolder1: {subfolder1: w1, l1}, {subfolder2: w2, l2}, parentfolder2...}
+	average_devices: bool
+		passed to uC_scale
+	'''
+	pixelDone = pyqtSignal(int, str, object)  # parent folder index, subfolder, OECT
+	folderDone = pyqtSignal(int, object)  # parent folder index, uC_dv
+	progress = pyqtSignal(int)  # pixels done so far
+	failed = pyqtSignal(str)  # the exception
+	finished = pyqtSignal(str)  # 'complete', 'cancelled' or 'failed'
+
+	def __init__(self, allPaths, dimDict, average_devices=False):
+		super(AnalysisWorker, self).__init__()
+		self.allPaths = allPaths
+		self.dimDict = dimDict
+		self.average_devices = average_devices
+		self.cancelled = False
+		self.done = 0
+		self.total = sum(len(paths) for paths in allPaths)
+
+	def cancel(self):
+		self.cancelled = True
+
+	@pyqtSlot()
+	def run(self):
+		try:
+			for i, paths in enumerate(self.allPaths):
+				if self.cancelled:
+					raise AnalysisCancelled()
+
+				def pixel_done(path, device, i=i):
+					self.done += 1
+					self.pixelDone.emit(i, path, device)
+					self.progress.emit(self.done)
+					if self.cancelled:
+						raise AnalysisCancelled()
+
+				_, uC_dv = uC_scale(list(paths), average_devices=self.average_devices, dimDict=self.dimDict,
+									thickness=100e-9, plot=[False, False], verbose=False, callback=pixel_done)
+				self.folderDone.emit(i, uC_dv)
+
+		except AnalysisCancelled:
+			self.finished.emit('cancelled')
+			return
+
+		except Exception as e:
+			self.failed.emit(repr(e))
+			self.finished.emit('failed')
+			return
+
+		self.finished.emit('complete')
+
+
 class MainWindow(QMainWindow):
 	MAX_PLOTS = 5
 
@@ -57,16 +125,20 @@ class MainWindow(QMainWindow):
 		self.loadPushbutton = QPushButton('Load parent folder')
 		self.averageCheckBox = QCheckBox('Average devices with the same WdL')
 		self.analyzePushButton = QPushButton('Analyze')
+		self.cancelPushButton = QPushButton('Cancel')
+		self.cancelPushButton.setEnabled(False)
+		self.progressBar = QProgressBar()
 		self.menuLayout.addWidget(self.loadPushbutton, 0, 0)
 		self.menuLayout.addWidget(self.scrollArea, 1, 0, 1, 2)
 		self.menuLayout.addWidget(self.averageCheckBox, 2, 0)
 		self.menuLayout.addWidget(self.analyzePushButton, 3, 0)
+		self.menuLayout.addWidget(self.cancelPushButton, 3, 1)
 		
 		self.menuLayout.setColumnStretch(0, 1)
 		self.menuLayout.setColumnStretch(1, 1)
 
 		self.textBrowser = QTextBrowser() #text browser displaying info
-		self.addPlaceHolder(self.menuLayout, [4, 0])
+		self.menuLayout.addWidget(self.progressBar, 4, 0, 1, 2)
 		self.menuLayout.addWidget(self.textBrowser, 5, 0, 1, 2)
 		self.menuLayout.setRowStretch(0, 1)
 		self.menuLayout.setRowStretch(1, 10)
@@ -109,6 +181,11 @@ class MainWindow(QMainWindow):
 		#setup ui signals
 		self.loadPushbutton.clicked.connect(self.open_file)
 		self.analyzePushButton.clicked.connect(self.analyze)
+		self.cancelPushButton.clicked.connect(self.cancel)
+
+		self.worker = None
+		self.workerThread = None
+		self.pixelPlots = {}  # per-pixel points shown until each parent folder is done
 
 	def open_file(self):
 		'''
@@ -194,7 +271,11 @@ class MainWindow(QMainWindow):
 	def analyze(self):
 		'''
 		Plot uC graphs.
+		Analysis runs in a background thread; results are shown as each pixel finishes
 		'''
+		if self.workerThread is not None:  # still running (or shutting down)
+			return
+
 		self.linearPlot.clearPlots()
 		self.logPlot.clearPlots()
 
@@ -225,18 +306,89 @@ class MainWindow(QMainWindow):
 			dimensionDict[parentFolderName] = parentFolderEntry
 			allPaths.append(subfolders)
 
-		#plot each parent folder
-		for i in range(self.MAX_PLOTS):
-			uC_scale(allPaths[i], average_devices=self.averageCheckBox.isChecked(), dimDict=dimensionDict, thickness=100e-9, 
-				pg_graphs=[self.linearPlot, self.logPlot], dot_color=pg.intColor(i, alpha=128), text_browser=self.textBrowser)
-			if i == len(allPaths) - 1: break
+		#plot each parent folder, up to MAX_PLOTS
+		self.worker = AnalysisWorker(allPaths[:self.MAX_PLOTS], dimensionDict,
+									 average_devices=self.averageCheckBox.isChecked())
+		self.workerThread = QThread()
+		self.worker.moveToThread(self.workerThread)
+
+		self.workerThread.started.connect(self.worker.run)
+		self.worker.pixelDone.connect(self.pixel_done)
+		self.worker.folderDone.connect(self.folder_done)
+		self.worker.progress.connect(self.progressBar.setValue)
+		self.worker.failed.connect(self.analysis_failed)
+		self.worker.finished.connect(self.analysis_finished)
+		self.worker.finished.connect(self.workerThread.quit)
+		self.workerThread.finished.connect(self.thread_finished)
+
+		self.pixelPlots = {}
+		self.progressBar.setMaximum(max(self.worker.total, 1))
+		self.progressBar.setValue(0)
+		self.analyzePushButton.setEnabled(False)
+		self.cancelPushButton.setEnabled(True)
+		self.workerThread.start()
+
+	def cancel(self):
+		'''
+		Stops the analysis after the pixel currently being processed
+		'''
+		if self.worker:
+			self.worker.cancel()
+			self.cancelPushButton.setEnabled(False)
+
+	def pixel_done(self, i, path, device):
+		'''
+		Shows a single processed pixel while the rest of its parent folder runs
+		'''
+		self.textBrowser.append(path)
+		if not device.gms.empty:
+			_print_gms(device, self.textBrowser)
+
+			x = np.abs(device.WdL * np.array(device.VgVts)) * 1e2
+			y = np.array(device.peak_gm) * 1000
+			x[x == 0] = 10e-10  #ensure log plot won't throw error
+			y[y == 0] = 10e-10
+			for plot in [self.linearPlot, self.logPlot]:
+				item = plot.plot(x, y, pen=None, symbolBrush=pg.intColor(i, alpha=128), symbol='o')
+				self.pixelPlots.setdefault(i, []).append((plot, item))
+
+	def folder_done(self, i, uC_dv):
+		'''
+		Replaces the per-pixel points of a parent folder with its uC* result,
+		and saves the scaling_uC figures in the parent folder
+		'''
+		for plot, item in self.pixelPlots.pop(i, []):
+			plot.removeItem(item)
+
+		plot_uC(uC_dv, [self.linearPlot, self.logPlot], dot_color=pg.intColor(i, alpha=128))
+		self.textBrowser.append('uC* = ' + str(uC_dv['uC_0'] * 1e-2) + ' F/cm*V*s')
+		self.textBrowser.append('Vt = ' + str(uC_dv['Vt']))
+
+	def analysis_failed(self, message):
+
+		self.textBrowser.append('Analysis failed: ' + message)
+
+	def analysis_finished(self, status):
+
+		self.cancelPushButton.setEnabled(False)
 
 		msg = QMessageBox()
-		msg.setIcon(QMessageBox.Information)
-		msg.setText("Analysis complete.")
+		msg.setIcon(QMessageBox.Warning if status == 'failed' else QMessageBox.Information)
+		msg.setText("Analysis " + status + ".")
 		msg.setWindowTitle("")
 		msg.exec()
 
+	def thread_finished(self):
+		'''
+		Frees the finished worker and its thread so Analyze can start a new one
+		'''
+		self.workerThread.wait()
+		self.worker.deleteLater()
+		self.workerThread.deleteLater()
+		self.worker = None
+		self.workerThread = None
+		self.analyzePushButton.setEnabled(True)
+
 	def addPlaceHolder(self, layout, coords=[]):
 		'''
 		Add a placeholder button.
@@ -263,9 +415,10 @@ class MainWindow(QMainWindow):
 		self.scrollAreaContents.removeWidget(groupBox)
 		groupBox.deleteLater()
 
-app = QApplication(sys.argv)
+if __name__ == '__main__':
+	app = QApplication(sys.argv)
 
-window = MainWindow()
-window.show()
+	window = MainWindow()
+	window.show()
 
-app.exec_()
\ No newline at end of file
+	app.exec_()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing of the processing stages (loading, gm, Vt, plotting...)
+
+Functions are marked as stages with the stage decorator (e.g. OECT.__init__,
+calc_gms, thresh, loadOECT and uC_scale). While profiling is off a stage only
+costs a flag check; once enabled, each stage records its calls and wall time,
+and optionally its peak memory (with tracemalloc).
+
+Usage:
+
+    >> import profiling
+    >> with profiling.profile(memory=True) as prof:
+    >>     pixels, uC_dv = oect_load.uC_scale(paths, plot=[False, False])
+    >> prof.report()
+
+    or, to log each stage call as it finishes:
+
+    >> profiling.enable(callback=lambda name, seconds, peak: print(name, seconds))
+    >> ...
+    >> profiling.disable()
+
+Stages run in other processes (e.g. uC_scale with workers) are not recorded.
+Times of a stage include the stages it calls.
+
+"""
+
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+_enabled = False
+_memory = False
+_callback = None
+_started_tracemalloc = False
+
+# stage name: [calls, total (s), max (s), peak memory (bytes) or None]
+_stats = {}
+
+# [traced memory at the start, peak seen so far] of each running stage
+_frames = []
+
+
+def stage(name):
+    '''
+    Decorator marking a function as the pipeline stage name
+
+    e.g.
+        @profiling.stage('OECT.calc_gms')
+        def calc_gms(self):
+    '''
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            with timed(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def timed(name):
+    '''
+    Records the code in a with block as the stage name (while profiling is enabled)
+    '''
+    if not _enabled:
+        yield
+        return
+
+    memory = _memory and tracemalloc.is_tracing()
+    if memory:
+        _push_frame()
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        peak = _pop_frame() if memory else None
+        _record(name, seconds, peak)
+
+
+def _push_frame():
+
+    current, peak = tracemalloc.get_traced_memory()
+    if _frames:
+        _frames[-1][1] = max(_frames[-1][1], peak)
+
+    # reset_peak is Python 3.9+; without it the peaks include earlier allocations
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+    _frames.append([current, 0])
+
+    return
+
+
+def _pop_frame():
+    '''
+    Peak memory (bytes) above the memory in use when the stage started
+    '''
+    _, peak = tracemalloc.get_traced_memory()
+    start, inner = _frames.pop()
+    peak = max(peak, inner)
+
+    if _frames:
+        _frames[-1][1] = max(_frames[-1][1], peak)
+
+    return peak - start
+
+
+def _record(name, seconds, peak):
+
+    st = _stats.setdefault(name, [0, 0.0, 0.0, None])
+    st[0] += 1
+    st[1] += seconds
+    st[2] = max(st[2], seconds)
+    if peak is not None:
+        st[3] = peak if st[3] is None else max(st[3], peak)
+
+    if _callback is not None:
+        _callback(name, seconds, peak)
+
+    return
+
+
+def enable(memory=False, callback=None):
+    '''
+    Starts recording the stages
+
+    memory : bool, optional
+        Also records the peak memory of each stage with tracemalloc (which
+        slows Python down considerably while it is on)
+    callback : function, optional
+        Called as callback(name, seconds, peak) after each stage call, peak
+        being the bytes allocated at most during it (None without memory)
+    '''
+    global _enabled, _memory, _callback, _started_tracemalloc
+
+    _memory = memory
+    _callback = callback
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+    _enabled = True
+
+    return
+
+
+def disable():
+    '''
+    Stops recording (the results are kept until reset)
+    '''
+    global _enabled, _callback, _started_tracemalloc
+
+    _enabled = False
+    _callback = None
+    _frames.clear()
+
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+    return
+
+
+def reset():
+    '''
+    Clears the recorded stages
+    '''
+    _stats.clear()
+
+    return
+
+
+def is_enabled():
+
+    return _enabled
+
+
+def stats(recorded=None):
+    '''
+    The recorded stages as a dict of
+    name: {'calls', 'total (s)', 'max (s)', 'peak memory (MB)'}
+    '''
+    recorded = _stats if recorded is None else recorded
+
+    return {name: {'calls': st[0], 'total (s)': st[1], 'max (s)': st[2],
+                   'peak memory (MB)': None if st[3] is None else st[3] / 2**20}
+            for name, st in recorded.items()}
+
+
+def report(recorded=None):
+    '''
+    The recorded stages as a DataFrame, slowest (total time) first, with columns
+    calls, total (s), mean (s), max (s) and peak memory (MB)
+    '''
+    df = pd.DataFrame.from_dict(stats(recorded), orient='index',
+                                columns=['calls', 'total (s)', 'max (s)', 'peak memory (MB)'])
+    df.insert(2, 'mean (s)', df['total (s)'] / df['calls'])
+    df['peak memory (MB)'] = df['peak memory (MB)'].astype(float)
+    df.index.name = 'stage'
+
+    return df.sort_values('total (s)', ascending=False)
+
+
+class Profile:
+    '''
+    What profile() yields; report() and stats() give the stages recorded in it
+    '''
+
+    def __init__(self):
+
+        self.recorded = {}
+
+    def stats(self):
+
+        return stats(self.recorded)
+
+    def report(self):
+
+        return report(self.recorded)
+
+
+@contextmanager
+def profile(memory=False, callback=None):
+    '''
+    Records the stages run in a with block, separately from any other recording
+
+    e.g.
+        with profiling.profile() as prof:
+            dv = oect.OECT(path)
+            dv.calc_gms()
+        print(prof.report())
+    '''
+    global _stats, _enabled, _memory, _callback, _started_tracemalloc
+
+    prof = Profile()
+    previous = (_enabled, _memory, _callback, _started_tracemalloc)
+    tracing = tracemalloc.is_tracing()
+    saved, _stats = _stats, prof.recorded
+
+    _started_tracemalloc = False
+    enable(memory=memory, callback=callback)
+    try:
+        yield prof
+    finally:
+        # puts back any recording this block is nested in, whose stages may
+        # still be running (so their frames stay and tracemalloc keeps going)
+        if not tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _stats = saved
+        _enabled, _memory, _callback, _started_tracemalloc = previous
+        if not _enabled:
+            _frames.clear()
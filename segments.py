@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the time-dependent readers in transient and timedep: finding
+the setpoint column and splitting a chunked log into runs of one setpoint
+
+Usage:
+
+    >> column = segments.setpoint_column(df.columns)
+    >> reader = pd.read_csv(path, sep='\t', chunksize=100000)
+    >> for setpoint, df in segments.split_segments(reader, column):
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def setpoint_column(columns):
+    '''
+    Name of the setpoint column of a time-dependent file: 'Setpoint', or the gate
+    current 'Ig (A) ' (or 'Ig (A)') of older files
+    '''
+    for column in ['Setpoint', 'Ig (A) ', 'Ig (A)']:
+        if column in columns:
+            return column
+
+    raise KeyError('No Setpoint or Ig (A) column')
+
+
+def split_segments(reader, column):
+    '''
+    Joins chunks from a pd.read_csv reader into runs of a constant value in column,
+    yielding (value, DataFrame) for each run once the next one starts
+    '''
+    parts = []
+    key = None
+
+    for chunk in reader:
+
+        values = chunk[column].values
+        change = np.flatnonzero(values[1:] != values[:-1]) + 1
+
+        for a, b in zip(np.append(0, change), np.append(change, len(values))):
+
+            if parts and values[a] != key:
+                yield key, pd.concat(parts)
+                parts = []
+
+            key = values[a]
+            parts.append(chunk.iloc[a:b])
+
+    if parts:
+        yield key, pd.concat(parts)
@@ -0,0 +1,44 @@
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+sys.path.insert(0,'..')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import cv
+import generators
+
+
+class TestCV:
+
+	#slice_cv/int_current
+	############################################################################
+
+	#test that the cycles and their integrated current are as with the cycle-by-cycle loop
+	#(expected values from that version)
+	def test_cv_generated(self, tmp_path):
+		path = generators.write_cv(str(tmp_path / 'cv.txt'), cycles=12, period=400)
+		# the loop needed as many whole cycles as peaks, so the trace ends just after the last peak
+		whole = str(tmp_path / 'whole.txt')
+		pd.read_csv(path, sep='\t').iloc[:12 * 400 + 100].to_csv(whole, sep='\t', index=False)
+		c = cv.cv(whole)
+		c.int_current()
+		assert (c.cycles == 12 and c.period == 400
+			and c.df_time.shape == (400, 12)
+			and np.isclose(c.df_time.values.sum(), 2.376080650636125e-05, rtol=1e-9)
+			and np.isclose(c.df_time.values[123, 7], -6.100614004110864e-07, rtol=1e-12)
+			and np.isclose(c.df_time.index[-1], 3.99)
+			and np.allclose(c.df_volt.index.values[[0, -1]], [0, -0.005])
+			and list(c.current_vs_cycle.index) == ['+', '-']
+			and np.allclose(c.current_vs_cycle.sum(axis=1), [6.236288105680787e-06, -5.998231864561935e-06], rtol=1e-9)
+			and np.isclose(c.current_vs_cycle.values[0, 0], 5.202446594180669e-07, rtol=1e-9)
+			and np.isclose(c.current_vs_cycle.values[1, 11], -4.981975521830618e-07, rtol=1e-9))
+
+	#test that a trailing partial cycle is dropped
+	def test_cv_partial_cycle(self, tmp_path):
+		c = cv.cv(generators.write_cv(str(tmp_path / 'cv.txt'), cycles=12, period=400))
+		c.int_current()
+		assert (c.cycles == 12
+			and c.df_time.shape == (400, 12)
+			and c.current_vs_cycle.shape == (2, 12))
@@ -0,0 +1,52 @@
+import os
+import io
+import sys
+import contextlib
+import pytest
+import numpy as np
+sys.path.insert(0,'..')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import device
+import oect_load
+import generators
+
+
+class TestDevice:
+
+	#save_h5/load_h5
+	############################################################################
+
+	#test that a device with more than 10 pixels reloads in the same order with the same results
+	def test_h5_round_trip(self, tmp_path):
+		paths = generators.write_wafer(str(tmp_path / 'wafer'), pixels=12)
+		with contextlib.redirect_stdout(io.StringIO()):
+			pixels, uC_dv = oect_load.uC_scale(paths, plot=[False, False])
+		dv = device.OECTDevice(pixels=pixels, params=uC_dv)
+		device.save_h5(dv, str(tmp_path / 'uC.h5'))
+		with device.load_h5(str(tmp_path / 'uC.h5')) as h5:
+			assert list(h5.pixels) == list(dv.pixels)
+			for key in dv.pixels:
+				assert (np.allclose(h5.pixels[key].Vts, dv.pixels[key].Vts)
+					and np.allclose(h5.pixels[key].peak_gm, dv.pixels[key].peak_gm)
+					and np.allclose(h5.pixels[key].gms.values, dv.pixels[key].gms.values))
+			assert (np.allclose(h5.params['uC'], dv.uC)
+				and np.allclose(h5.params['uC_0'], dv.uC_0))
+
+	#test that frame() reads back the column names as str and picks out the requested columns
+	def test_h5_frame_columns(self, tmp_path):
+		paths = generators.write_wafer(str(tmp_path / 'wafer'), pixels=2)
+		with contextlib.redirect_stdout(io.StringIO()):
+			pixels, uC_dv = oect_load.uC_scale(paths, plot=[False, False])
+		dv = device.OECTDevice(pixels=pixels, params=uC_dv)
+		device.save_h5(dv, str(tmp_path / 'uC.h5'))
+		key = list(dv.pixels)[0]
+		transfers = dv.pixels[key].transfers
+		columns = [str(c) for c in transfers.columns[::-1]]
+		with device.load_h5(str(tmp_path / 'uC.h5')) as h5:
+			df = h5.pixels[key].frame('transfers', columns=columns)
+			names = list(h5.pixels[key].transfers.columns)
+		assert (names == [str(c) for c in transfers.columns]
+			and all(type(c) is str for c in names)
+			and list(df.columns) == columns
+			and np.allclose(df.values, transfers[transfers.columns[::-1]].values))
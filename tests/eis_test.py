@@ -0,0 +1,67 @@
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+sys.path.insert(0,'..')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import eis
+import generators
+
+
+class TestEIS:
+
+	#read_eis
+	############################################################################
+
+	#test that read_eis splits a generated export into the same blocks, as a dict or stacked
+	#(expected values from the object-dtype parser it replaced)
+	def test_read_eis_generated(self, tmp_path):
+		path = generators.write_eis(str(tmp_path / 'eis.txt'), biases=6, frequencies=20)
+		edv = eis.read_eis(path)
+		stacked = eis.read_eis(path, stacked=True)
+		columns = ['Index', 'Frequency (Hz)', "Z' (Ω)", "-Z'' (Ω)", 'Z (Ω)', '-Phase (°)', 'Time (s)',
+			"Z' (Ω).1", "-Z'' (Ω).1", 'Z (Ω).1', '-Phase (°).1']
+		#bias: sum of Z'
+		expected = {-0.2: 77497.161, -0.04: 75761.571, 0.12: 57435.188, 0.28: 38406.963, 0.44: 35869.732, 0.6: 36062.324}
+		assert (list(edv) == list(expected)
+			and all(list(edv[v].columns) == columns and (edv[v].dtypes == float).all() for v in edv)
+			and [list(edv[v].index[[0, -1]]) for v in edv] == [[21 * n, 21 * n + 19] for n in range(6)]
+			and all(np.isclose(edv[v]["Z' (Ω)"].sum(), z, rtol=1e-12) for v, z in expected.items())
+			and np.isclose(sum(edv[v].values.sum() for v in edv), 2811157.9324282, rtol=1e-12)
+			and list(stacked.index.unique(level=0)) == list(expected)
+			and list(stacked.columns) == columns
+			and all(np.array_equal(stacked.loc[v].values, edv[v].values) for v in edv))
+
+	#fit_biases
+	############################################################################
+
+	#test that fit_biases recovers the R(RC) parameters of a generated export, from the dict or stacked
+	def test_fit_biases_rc(self, tmp_path):
+		path = generators.write_eis(str(tmp_path / 'eis.txt'), biases=5, frequencies=50)
+		fits = eis.fit_biases(eis.read_eis(path), 'RC', volume=1e-6)
+		stacked = eis.fit_biases(eis.read_eis(path, stacked=True), 'RC', volume=1e-6)
+		v = fits.index.values
+		C = 1e-6 * (1 + 20 / (1 + np.exp(-(v - 0.2) / 0.05)))
+		assert (fits['success'].all()
+			and np.allclose(fits['Rs'], 150, rtol=0.01)
+			and np.allclose(fits['Rp'], 1e4, rtol=0.01)
+			and np.allclose(fits['C (F)'], C, rtol=0.01)
+			and np.allclose(fits['C* (F/cm^3)'], C / 1e-6, rtol=0.01)
+			and fits.equals(stacked))
+
+	#test that fit_biases recovers Randles CPE parameters at each bias, in one process or two
+	def test_fit_biases_randles_cpe(self):
+		f = np.logspace(5, -1, 40)
+		truth = pd.DataFrame({'Rs': [100, 120, 140], 'Rct': [5e3, 2e4, 8e4],
+			'Q': [2e-6, 5e-6, 1e-5], 'n': [0.95, 0.9, 0.85]}, index=[0.0, 0.2, 0.4])
+		edv = {}
+		for v, p in truth.iterrows():
+			Z = eis.CIRCUITS['randles_cpe'][0](f, *p.values)[0]
+			edv[v] = pd.DataFrame({'Frequency (Hz)': f, "Z' (Ω)": Z.real, "-Z'' (Ω)": -Z.imag})
+		fits = eis.fit_biases(edv, 'randles_cpe')
+		pooled = eis.fit_biases(edv, 'randles_cpe', workers=2)
+		assert (fits['success'].all()
+			and np.allclose(fits[truth.columns].values, truth.values, rtol=0.01)
+			and np.allclose(pooled[truth.columns].values, fits[truth.columns].values))
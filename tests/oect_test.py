@@ -5,7 +5,15 @@ import configparser
 import numpy as np
 sys.path.insert(0,'..')
 
+import io
+import contextlib
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
 import oect
+import oect_load
+import profiling
+import generators
 
 
 #most values are hardcoded - be careful if modifying cfg/txt files
@@ -56,7 +64,8 @@ class TestOECT:
 			and test_oect.options['Reverse'] == True
 			and test_oect.options['Average'] == False
 			and test_oect.options['V_low'] == False
-			and test_oect.options['overwrite'] == False)
+			and test_oect.options['overwrite'] == False
+			and test_oect.options['vt_method'] == 'cwt')
 
 	#test that TypeError is raised when parameters passed are not dicts
 	def test_set_params_not_dict(self):
@@ -154,6 +163,43 @@ class TestOECT:
 		test_oect = oect.OECT(folder='tests/test_device/01') #called in init
 		assert test_oect.num_transfers == 2
 
+	#calc_gms
+	##################################################################
+
+	#test that the batched gms match calculating each transfer curve separately
+	def test_calc_gms_matches_single(self):
+		test_oect = oect.OECT(folder='tests/test_device/01')
+		test_oect.calc_gms()
+		gm_fwd, gm_bwd, gm_peaks = test_oect._calc_gm(test_oect.transfer['-0.6_0'])
+		assert (np.allclose(test_oect.gm_fwd['-0.6_0'].values, gm_fwd.values)
+			and np.allclose(test_oect.gm_bwd['-0.6_0'].values, gm_bwd.values)
+			and np.allclose(test_oect.peak_gm, gm_peaks['peak gm (S)'].values)
+			and list(test_oect.gms.columns) == ['gm_-0.6_0', 'gm_-0.6_1'])
+
+	#thresh
+	##################################################################
+
+	#test that the linear threshold engine agrees with the CWT one
+	def test_thresh_linear(self):
+		test_oect = oect.OECT(folder='tests/test_device/01')
+		test_oect.calc_gms()
+		test_oect.thresh()
+		Vts = test_oect.Vts
+		test_oect.options['vt_method'] = 'linear'
+		test_oect.thresh()
+		assert np.allclose(test_oect.Vts, Vts, atol=5e-3)
+
+	#test that a candidate window with a positive slope is skipped rather than giving Vt = -inf
+	def test_min_fit_positive_slope(self):
+		test_oect = oect.OECT(folder='tests/test_device/01')
+		test_oect.calc_gms()
+		V = np.linspace(-1, 0.2, 49)
+		Id = np.clip(-(V + 0.4), 0, None)
+		Id[:5] = np.linspace(0.5, 0.6, 5)
+		test_oect._find_peak = lambda *args, **kwargs: [5, 20]
+		fit = test_oect._min_fit(Id, V)
+		assert fit[0] < 0 and np.isclose(-fit[1] / fit[0], -0.4, atol=0.02)
+
 	#_reverse
 	###################################################################
 	
@@ -172,6 +218,40 @@ class TestOECT:
 		assert len(v) // 2, True == test_oect._reverse(v)
 
 
+	#profiling
+	######################################################################
+
+	#test that stages are only recorded inside profile()
+	def test_profile_stages(self):
+		with profiling.profile() as prof:
+			test_oect = oect.OECT(folder='tests/test_device/01')
+			test_oect.calc_gms()
+			test_oect.calc_gms()
+		test_oect.thresh()
+		report = prof.report()
+		assert (report.loc['OECT.__init__', 'calls'] == 1
+			and report.loc['OECT.calc_gms', 'calls'] == 2
+			and 'OECT.thresh' not in report.index
+			and not profiling.is_enabled())
+
+	#test that a profile() nested in a memory-profiling one leaves the outer stage running
+	def test_profile_nested(self):
+		with profiling.profile(memory=True) as outer:
+			with profiling.timed('outer'):
+				a = np.ones(100000)
+				with profiling.profile(memory=True) as inner:
+					with profiling.timed('inner'):
+						b = np.ones(200000)
+				tracing = tracemalloc.is_tracing()
+				c = np.ones(300000)
+		assert (list(outer.stats()) == ['outer']
+			and list(inner.stats()) == ['inner']
+			and tracing
+			and outer.stats()['outer']['peak memory (MB)'] > 4.5
+			and not tracemalloc.is_tracing()
+			and not profiling.is_enabled())
+
+
 	#update_config
 	######################################################################
 	
@@ -252,6 +332,69 @@ class TestOECT:
 		with pytest.raises(configparser.MissingSectionHeaderError):
 			params, opts = oect.config_file('tests/dummy_file.py')
 
+	#uC_scale workers
+	#############################################################
+
+	#test that loading the pixels in a process pool gives the same results as one at a time
+	def test_uC_scale_workers(self, tmp_path):
+		paths = generators.write_wafer(str(tmp_path / 'wafer'), pixels=3)
+		with contextlib.redirect_stdout(io.StringIO()):
+			pixels, uC_dv = oect_load.uC_scale(list(paths), plot=[False, False])
+			pooled, uC_pooled = oect_load.uC_scale(list(paths), plot=[False, False], workers=2)
+		assert (list(pooled) == list(pixels)
+			and all(np.allclose(pooled[k].Vts, pixels[k].Vts) for k in pixels)
+			and np.allclose(uC_pooled['uC'], uC_dv['uC'])
+			and np.allclose(uC_pooled['uC_0'], uC_dv['uC_0']))
+
+	#uC_scale cache
+	#############################################################
+
+	#test that a cached run matches, and that only a touched pixel is reprocessed
+	def test_uC_scale_cache(self, tmp_path):
+		paths = generators.write_wafer(str(tmp_path / 'wafer'), pixels=3)
+		cache_files = [os.path.join(p, oect_load.CACHE_FILE) for p in paths]
+		with contextlib.redirect_stdout(io.StringIO()):
+			with profiling.profile() as first:
+				pixels, uC_dv = oect_load.uC_scale(list(paths), plot=[False, False], cache=True)
+			written = [os.stat(f).st_mtime_ns for f in cache_files]
+			with profiling.profile() as second:
+				pixels2, uC_dv2 = oect_load.uC_scale(list(paths), plot=[False, False], cache=True)
+			transfer = os.path.join(paths[1], 'bench_transfer_0.txt')
+			os.utime(transfer, ns=(os.stat(transfer).st_atime_ns, os.stat(transfer).st_mtime_ns + 10**9))
+			with profiling.profile() as third:
+				oect_load.uC_scale(list(paths), plot=[False, False], cache=True)
+		assert (first.stats()['OECT.__init__']['calls'] == 3
+			and 'OECT.__init__' not in second.stats()
+			and third.stats()['OECT.__init__']['calls'] == 1
+			and [os.stat(f).st_mtime_ns != w for f, w in zip(cache_files, written)] == [False, True, False]
+			and list(pixels2) == list(pixels)
+			and all(np.allclose(pixels2[k].Vts, pixels[k].Vts) for k in pixels)
+			and np.allclose(uC_dv2['uC'], uC_dv['uC']))
+
+	#UCWatcher
+	#############################################################
+
+	#test that the first poll fits every pixel, an idle poll does nothing and a
+	#touched file refits only its folder
+	def test_uc_watcher_poll(self, tmp_path):
+		paths = generators.write_wafer(str(tmp_path / 'wafer'), pixels=3)
+		watcher = oect_load.UCWatcher(str(tmp_path / 'wafer'))
+		with contextlib.redirect_stdout(io.StringIO()):
+			first = watcher.poll()
+			uC_dv = watcher.uC_dv
+			idle = watcher.poll()
+			transfer = os.path.join(paths[2], 'bench_transfer_0.txt')
+			os.utime(transfer, ns=(os.stat(transfer).st_atime_ns, os.stat(transfer).st_mtime_ns + 10**9))
+			with profiling.profile() as touched:
+				changed = watcher.poll()
+		assert (first == paths
+			and list(watcher.pixels) == [p + '_uC' for p in paths]
+			and idle == []
+			and changed == [paths[2]]
+			and touched.stats()['OECT.__init__']['calls'] == 1
+			and watcher.uC_dv is not uC_dv
+			and np.allclose(watcher.uC_dv['uC'], uC_dv['uC']))
+
 
 
 	#questions/why I didn't write tests for these functions
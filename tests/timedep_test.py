@@ -0,0 +1,34 @@
+import os
+import sys
+import subprocess
+import pytest
+import numpy as np
+import pandas as pd
+sys.path.insert(0,'..')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import timedep
+import generators
+
+
+class TestTimedep:
+
+	#read_time_dep
+	############################################################################
+
+	#test that files with a Setpoint column (and no Ig (A)) can be read, cropped and plotted
+	def test_setpoint_layout(self, tmp_path):
+		df = timedep.read_time_dep(generators.write_time_dep(str(tmp_path / 'time_dep.txt'), setpoints=3, points=200))
+		mx, npts = timedep.find_turnon(df, df.currents[0])
+		df_total, device = timedep.crop_fixed(df, timeon=1000)
+		timedep.plot_current(df, norm=True)
+		assert (npts == 200
+			and list(device) == list(df.currents)
+			and [len(device[i]) for i in device] == [190, 200, 200])
+
+	#test that timedep does not need transient (and so lmfit)
+	def test_no_lmfit(self):
+		code = 'import sys; import timedep; print("lmfit" in sys.modules)'
+		out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+			cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+		assert out.stdout.strip() == 'False'
@@ -0,0 +1,131 @@
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+sys.path.insert(0,'..')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import lmfit
+from scipy.optimize import fsolve
+import transient
+import generators
+
+
+class TestTransient:
+
+	#model_friedlein
+	############################################################################
+
+	#test that the friedlein fit runs and recovers tau = Rs * (Cd + Cs) of a synthetic trace
+	def test_model_friedlein(self):
+		params = transient.fmParams(lmfit.Model(transient.friedlein_multi, independent_vars=['t'])).valuesdict()
+		params['Cd'] = 2e-2
+		t = np.linspace(0, 100, 400)
+		Ids = transient.friedlein_multi(t, **params)
+		device = {-0.8: pd.DataFrame({'Ids (A)': -Ids}, index=t)}
+		_, result = transient.model_friedlein(device, -0.8, plot=False, verbose=False)
+		p = result.params.valuesdict()
+		assert (result.success
+			and np.isclose(p['Rs'] * (p['Cd'] + p['Cs']), 30, rtol=1e-3)
+			and np.allclose(result.best_fit, np.abs(Ids), rtol=1e-3))
+
+	#friedlein_multi
+	############################################################################
+
+	#test that the vectorized model gives the point-by-point values through all three regimes
+	#(expected values from the point-by-point version)
+	def test_friedlein_multi_regimes(self):
+		t = np.linspace(0, 20, 500)
+		params = {'mu': 1, 'Cd': 1e-7, 'Cs': 1e-7, 'L': 20e-4, 'Vg': -0.5, 'Rs': 2e7,
+			'Vt': -0.2, 'Vd': -0.1, 'Ierr': 1e-6}
+		Ids, regime = transient.friedlein_multi(t, return_regime=True, **params)
+		assert (list(regime) == ['lin'] * 23 + ['sat'] * 28 + ['sub'] * 449
+			and np.allclose(Ids[[0, 10, 30, 100, 499]], [-0.0012490000000000003, -0.0010106402651505104,
+				0.00012415357190201538, 0.00033989004736843564, 0.0022007491470678745], rtol=1e-12)
+			and np.isclose(Ids.sum(), 0.6571514247683324, rtol=1e-12)
+			and np.array_equal(transient.friedlein_multi(t, **params), Ids))
+
+	#iter_time_dep
+	############################################################################
+
+	#test that files with the older Ig (A) setpoint column read the same in chunks as at once
+	def test_iter_time_dep_old_layout(self, tmp_path):
+		new = pd.read_csv(generators.write_time_dep(str(tmp_path / 'new.txt'), setpoints=4, points=500), sep='\t')
+		old = pd.DataFrame({'Time (s)': new['Time (s)'], 'Ig (A) ': np.repeat([-1e-7, -2e-7, -3e-7, -4e-7], 500),
+			'Ids (A)': new['Ids (A)'], 'Voltage (V)': new['Voltage (V)']})
+		old.to_csv(str(tmp_path / 'old.txt'), sep='\t', index=False)
+		df, device = transient.read_time_dep(str(tmp_path / 'old.txt'))
+		segments = list(transient.iter_time_dep(str(tmp_path / 'old.txt'), chunksize=300))
+		converted = pd.concat([d for _, d in transient.iter_time_dep(str(tmp_path / 'old.txt'), convert=True, chunksize=300)])
+		assert ([sp for sp, _ in segments] == list(device)
+			and all(d.equals(device[sp]) for sp, d in segments)
+			and converted.equals(df)
+			and df.is_cc)
+
+	#read_time_dep
+	############################################################################
+
+	#test that read_time_dep crops and splits the setpoints of a generated log as before it was vectorized
+	#(expected values from the setpoint-by-setpoint version, with and without a voltage limit)
+	def test_read_time_dep_generated(self, tmp_path):
+		path = generators.write_time_dep(str(tmp_path / 'time_dep.txt'), setpoints=5, points=800)
+		#setpoint: (points, last time (s), sum of Ids (A))
+		expected = {None: {-0.9: (500, 49.9, -0.5500091181104374), -0.65: (800, 79.9, -0.6687723301411188),
+				-0.4: (800, 79.9, -0.4734955172456138), -0.15: (800, 79.9, -0.276289961178779),
+				0.1: (800, 79.9, -0.07810444202985098)},
+			-0.905: {-0.9: (253, 49.5, -0.27827913269197013), -0.65: (800, 79.9, -0.6687723301411188),
+				-0.4: (800, 79.9, -0.4734955172456138), -0.15: (800, 79.9, -0.276289961178779),
+				0.1: (800, 79.9, -0.07810444202985098)}}
+		totals = {None: -2046.6713687058, -0.905: -1774.9413832873324}
+		for v_limit in expected:
+			df, device = transient.read_time_dep(path, v_limit=v_limit)
+			assert (list(device) == list(expected[v_limit])
+				and all(len(device[sp]) == n and device[sp].index[0] == 0 and np.isclose(device[sp].index[-1], t)
+					and np.isclose(device[sp]['Ids (A)'].sum(), ids, rtol=1e-9)
+					for sp, (n, t, ids) in expected[v_limit].items())
+				and np.isclose(df['Ids (mA)'].sum(), totals[v_limit], rtol=1e-9)
+				and list(df.columns) == ['Setpoint Voltage (V)', 'Ids (mA)', 'Error (mA)', 'Current (mA)', 'Voltage (V)']
+				and list(df.setpoints) == list(expected[v_limit])
+				and df.is_cv)
+
+	#getVt
+	############################################################################
+
+	#test that the closed-form roots match fsolve at each channel voltage
+	def test_getVt_matches_fsolve(self):
+		K = 1e-3 * 4e-2 / 20e-4 ** 2
+		Vch = -0.5 * (1 - np.exp(-np.linspace(0, 10, 50) / 2))
+		expected = [fsolve(transient.vtdiff, -0.5, args=(K, v, -0.6))[0] for v in Vch]
+		Vt, roots = transient.getVt(-0.5, K, Vch, -0.6)
+		assert (np.allclose(roots, expected, atol=1e-6)
+			and Vt == roots[-1]
+			and np.allclose(transient.vtdiff(roots, K, Vch, -0.6), 0)
+			and np.all(transient.getVt(-0.5, 0, Vch, -0.6)[1] == -0.5))
+
+	#fit_setpoints
+	############################################################################
+
+	#test that fit_setpoints gives the model_friedlein results for the chosen setpoints, in one process or two
+	def test_fit_setpoints(self, tmp_path):
+		path = generators.write_time_dep(str(tmp_path / 'time_dep.txt'), setpoints=3, points=600)
+		fits = transient.fit_setpoints(path, setpoints=[-0.9, 0.1])
+		pooled = transient.fit_setpoints(path, setpoints=[-0.9, 0.1], workers=2)
+		_, device = transient.read_time_dep(path)
+		_, result = transient.model_friedlein(device, -0.9, plot=False, verbose=False)
+		values = fits.loc[fits['setpoint'] == -0.9].set_index('parameter')['value']
+		assert (list(pd.unique(fits['setpoint'])) == [-0.9, 0.1]
+			and fits['error'].isna().all()
+			and all(np.isclose(values[n], p.value) for n, p in result.params.items())
+			and fits.drop(columns='fit time (s)').equals(pooled.drop(columns='fit time (s)')))
+
+	#test that fit_setpoints does not carry params from one setpoint to the next, so serial and pooled fits match
+	def test_fit_setpoints_params(self, tmp_path):
+		path = generators.write_time_dep(str(tmp_path / 'time_dep.txt'), setpoints=3, points=600)
+		params = transient.fmParams(lmfit.Model(transient.friedlein_multi, independent_vars=['t']))
+		initial = params.valuesdict()
+		fits = transient.fit_setpoints(path, params=params)
+		pooled = transient.fit_setpoints(path, params=params, workers=2)
+		assert (params.valuesdict() == initial
+			and fits['error'].isna().all()
+			and fits.drop(columns='fit time (s)').equals(pooled.drop(columns='fit time (s)')))
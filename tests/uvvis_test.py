@@ -0,0 +1,140 @@
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+sys.path.insert(0,'..')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import uvvis
+import generators
+
+
+def _uv_vis(folder, potentials=(0, 0.5, 1)):
+	'''
+	A uv_vis object with generated time-dependent spectra at each potential
+	'''
+	specs = [generators.write_spectra(str(folder / 'spectra_{}.txt'.format(n)), runs=20,
+		wavelengths=128, seed=n) for n in range(len(potentials))]
+	uv = uvvis.uv_vis(None, specs, list(potentials))
+	uv.time_dep_spectra(specs)
+	return uv
+
+
+class TestUVVis:
+
+	#time_dep_spectra
+	############################################################################
+
+	#test that extra spectra files are warned about and missing ones raise
+	def test_time_dep_spectra_file_count(self, tmp_path):
+		specs = [generators.write_spectra(str(tmp_path / 'spectra_{}.txt'.format(n)), runs=10,
+			wavelengths=64, seed=n) for n in range(3)]
+		uv = uvvis.uv_vis(None, specs, [0, 0.5])
+		with pytest.warns(UserWarning):
+			uv.time_dep_spectra(specs)
+		assert list(uv.spectra_vs_time) == [0, 0.5]
+		uv = uvvis.uv_vis(None, specs, [0, 0.5, 1, 1.5])
+		with pytest.raises(ValueError):
+			uv.time_dep_spectra(specs)
+
+	#read_time_spectra
+	############################################################################
+
+	#test that read_time_spectra gives the spectrum-by-spectrum values, with and without the
+	#Spectrum number column, smoothing and rounding (expected values from that version)
+	def test_read_time_spectra_generated(self, tmp_path):
+		path = generators.write_spectra(str(tmp_path / 'spectra.txt'), runs=20, wavelengths=128)
+		unnumbered = str(tmp_path / 'unnumbered.txt')
+		pd.read_csv(path, sep='\t').drop(columns='Spectrum number').to_csv(unnumbered, sep='\t', index=False)
+		#(file, smooth, digits): (first and last wavelength, sum, absorbance at [64, 10] and [0, 0])
+		expected = {(path, 3, None): ((300.1234, 1000.5678), 316.78499701987886, 0.07054840801682806, -2.1248804495729752e-05),
+			(path, None, 2): ((300.12, 1000.57), 316.82067756828724, 0.0714392318394814, 0.001257302214044),
+			(unnumbered, 5, None): ((300.1234, 1000.5678), 316.7426563209993, 0.0667296327203871, 0.0012680960200403312)}
+		for (p, smooth, digits), (wl, total, middle, corner) in expected.items():
+			df = uvvis.read_time_spectra(p, smooth=smooth, digits=digits)
+			assert (df.shape == (128, 20)
+				and np.allclose(df.index.values[[0, -1]], wl)
+				and np.array_equal(df.columns.values, np.arange(20.0))
+				and np.isclose(df.values.sum(), total, rtol=1e-9)
+				and np.isclose(df.values[64, 10], middle, rtol=1e-9)
+				and np.isclose(df.values[0, 0], corner, rtol=1e-9))
+
+	#SpectraCube
+	############################################################################
+
+	#test that a saved, memory-mapped cube gives back the spectra_vs_time DataFrames
+	def test_spectra_cube(self, tmp_path):
+		uv = _uv_vis(tmp_path)
+		uvvis.SpectraCube.from_dict(uv.spectra_vs_time, path=str(tmp_path / 'cube'))
+		cube = uvvis.SpectraCube.load(str(tmp_path / 'cube'))
+		assert (list(cube) == list(uv.spectra_vs_time)
+			and isinstance(cube.data, np.memmap)
+			and all(cube[p].equals(uv.spectra_vs_time[p]) for p in uv.spectra_vs_time)
+			and np.array_equal(cube.wavelength(800).loc[0.5].values,
+				uv.spectra_vs_time[0.5].iloc[cube.wavelengths.searchsorted(800)].values)
+			and np.array_equal(cube.time_slice(3)[1].values, uv.spectra_vs_time[1].iloc[:, 3].values))
+
+	#save_h5/convert_h5
+	############################################################################
+
+	#test that spectra saved as an HDF5 cube read back the same, lazily or in memory
+	def test_h5_round_trip(self, tmp_path):
+		uv = _uv_vis(tmp_path)
+		uvvis.save_h5(uv, str(tmp_path / 'spectra.h5'))
+		data = uvvis.convert_h5(str(tmp_path / 'spectra.h5'), lazy=False)
+		lazy = uvvis.convert_h5(str(tmp_path / 'spectra.h5'))
+		equal = (list(data.potentials) == list(uv.potentials)
+			and all(np.array_equal(data.spectra_vs_time[p].values, uv.spectra_vs_time[p].values)
+				and data.spectra_vs_time[p].index.equals(uv.spectra_vs_time[p].index)
+				and data.spectra_vs_time[p].columns.equals(uv.spectra_vs_time[p].columns)
+				for p in uv.spectra_vs_time)
+			and np.array_equal(lazy.spectra_vs_time.wavelength(800).values,
+				data.spectra_vs_time.wavelength(800).values))
+		lazy.spectra_vs_time.close()
+		assert equal
+
+	#banded_fits
+	############################################################################
+
+	#test that the all-wavelength exponential fit recovers tau and agrees with curve_fit
+	def test_banded_fits_vp(self):
+		rng = np.random.default_rng(0)
+		wl = np.arange(600, 1000, 2.0)
+		t = np.arange(100, dtype=float)
+		tau = 5 + 25 * (wl - 600) / 400
+		data = 0.1 + 0.5 * np.exp(-t[None, :] / tau[:, None]) + 1e-4 * rng.standard_normal((len(wl), len(t)))
+		uv = uvvis.uv_vis(None, None, [1])
+		uv.spectra_vs_time = {1: pd.DataFrame(data, index=wl, columns=t)}
+		uv.banded_fits(700, 900, voltage=1, method='vp')
+		fits = uv.fit_params
+		expected = [uvvis.curve_fit(uvvis.fit_exp, t, uv.spectra_vs_time[1].loc[w], p0=[0, 1, 10])[0][2]
+			for w in fits.index]
+		assert (np.allclose(fits['tau'], tau[np.searchsorted(wl, fits.index)], rtol=1e-2)
+			and np.allclose(fits['tau'], expected, rtol=1e-4)
+			and np.array_equal(uv.fits, fits['tau'].values))
+
+	#test that reading the spectra files in a process pool gives the same spectra as one at a time
+	def test_time_dep_spectra_workers(self, tmp_path):
+		uv = _uv_vis(tmp_path)
+		specs = [str(tmp_path / 'spectra_{}.txt'.format(n)) for n in range(len(uv.potentials))]
+		pooled = uvvis.uv_vis(None, specs, uv.potentials)
+		pooled.time_dep_spectra(specs, workers=2)
+		assert (list(pooled.spectra_vs_time) == list(uv.spectra_vs_time)
+			and all(pooled.spectra_vs_time[p].equals(uv.spectra_vs_time[p]) for p in uv.spectra_vs_time))
+
+	#test that the biexponential fits in a process pool match the ones in this process
+	def test_banded_fits_workers(self):
+		rng = np.random.default_rng(0)
+		wl = np.arange(700, 760, 2.0)
+		t = np.arange(100, dtype=float)
+		data = (0.1 + 0.3 * np.exp(-t[None, :] / (3 + wl[:, None] / 100)) + 0.2 * np.exp(-t[None, :] / 40)
+			+ 1e-4 * rng.standard_normal((len(wl), len(t))))
+		uv = uvvis.uv_vis(None, None, [1])
+		uv.spectra_vs_time = {1: pd.DataFrame(data, index=wl, columns=t)}
+		uv.banded_fits(700, 760, voltage=1, fittype='biexp', method='vp')
+		fits, params = uv.fits, uv.fit_params
+		uv.banded_fits(700, 760, voltage=1, fittype='biexp', method='vp', workers=2)
+		assert (np.allclose(uv.fits, fits, equal_nan=True)
+			and uv.fit_params.index.equals(params.index)
+			and np.allclose(uv.fit_params.values, params.values, equal_nan=True))
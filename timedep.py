@@ -5,11 +5,15 @@ Created on Thu May  9 14:15:37 2019
 @author: GingerLab
 """
 
+from itertools import chain
+
 import numpy as np
 from scipy.optimize import curve_fit
 import pandas as pd
 from matplotlib import pyplot as plt
 
+from segments import setpoint_column, split_segments
+
 
 def read_time_dep(path):
     '''
@@ -19,33 +23,52 @@ def read_time_dep(path):
     '''
     df = pd.read_csv(path, sep='\t')
     df = df.set_index('Time (s)')
-    try:
-        currents = pd.unique(df['Ig (A) '])
-    except:
-        currents = pd.unique(df['Ig (A)'])
+    currents = pd.unique(df[setpoint_column(df.columns)])
 
     df.currents = currents
 
     return df
 
 
+def iter_time_dep(path, chunksize=100000):
+    '''
+    Reads the time-dependent data in chunks and yields each gate current as soon
+    as it has been read, so long logs can be processed without loading the whole file
+    
+    Currents are assumed to be measured one after another; a current that appears
+    again later is yielded again as a new segment
+    
+    Yields (current, DataFrame), with the columns and index of read_time_dep
+    '''
+    reader = pd.read_csv(path, sep='\t', chunksize=chunksize, index_col='Time (s)')
+
+    first = next(reader, None)
+    if first is None:
+        return
+
+    column = setpoint_column(first.columns)
+
+    yield from split_segments(chain([first], reader), column)
+
+
 def plot_current(df, norm=False):
     fig, ax = plt.subplots(figsize=(5, 5))
+    sp = setpoint_column(df.columns)
 
     for i in df.currents:
         if norm:
-            xx = df.loc[df['Ig (A) '] == i]['Ids (A)'].index.values
-            yy = df.loc[df['Ig (A) '] == i]['Ids (A)'].values
+            xx = df.loc[df[sp] == i]['Ids (A)'].index.values
+            yy = df.loc[df[sp] == i]['Ids (A)'].values
             yy = (yy - np.min(yy)) / (np.max(yy) - np.min(yy))
             ax.plot(xx, yy)
         else:
-            ax.plot(df.loc[df['Ig (A) '] == i]['Ids (A)'])
+            ax.plot(df.loc[df[sp] == i]['Ids (A)'])
 
     return ax
 
 
 def find_turnon(df, current=-1e-7):
-    npts = len(df.loc[df['Ig (A) '] == current])
+    npts = len(df.loc[df[setpoint_column(df.columns)] == current])
 
     tx = df.index.values[:npts]
 
@@ -74,16 +97,17 @@ def crop_prepulse(df):
 
     df_total = pd.DataFrame()
     device = {}
+    sp = setpoint_column(df.columns)
 
     for i in df.currents:
         d = pd.DataFrame()
         mx, npts = find_turnon(df, i)
         print(i)
-        f = int(np.floor(df.loc[df['Ig (A) '] == i].index.values[mx] / 10000)) * 10000
+        f = int(np.floor(df.loc[df[sp] == i].index.values[mx] / 10000)) * 10000
         if f == 0:
             f = 10000
-        xx = df.loc[df['Ig (A) '] == i].loc[f:].index.values
-        yy = df.loc[df['Ig (A) '] == i]['Ids (A)'].loc[f:].values
+        xx = df.loc[df[sp] == i].loc[f:].index.values
+        yy = df.loc[df[sp] == i]['Ids (A)'].loc[f:].values
         d[i] = yy
         d = d.set_index(xx - xx[0])
         device[i] = d
@@ -109,15 +133,16 @@ def crop_fixed(df, timeon=10000):
 
     df_total = pd.DataFrame()
     device = {}
+    sp = setpoint_column(df.columns)
 
     for i in df.currents:
         d = pd.DataFrame()
         print(i)
         f = df.index.searchsorted(timeon)
-        f = df.loc[df['Ig (A) '] == i].index.searchsorted(timeon)
+        f = df.loc[df[sp] == i].index.searchsorted(timeon)
 
-        xx = df.loc[df['Ig (A) '] == i].iloc[f:].index.values
-        yy = df.loc[df['Ig (A) '] == i]['Ids (A)'].iloc[f:].values
+        xx = df.loc[df[sp] == i].iloc[f:].index.values
+        yy = df.loc[df[sp] == i]['Ids (A)'].iloc[f:].values
         d[i] = yy
         d = d.set_index(xx - xx[0])
         device[i] = d
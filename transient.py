@@ -5,14 +5,20 @@ Created on Thu May  9 14:15:37 2019
 @author: GingerLab
 """
 
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 from scipy.optimize import curve_fit
-from scipy.optimize import fsolve
 import pandas as pd
 from matplotlib import pyplot as plt
 
 import lmfit
 
+from segments import setpoint_column, split_segments
+
 
 def read_time_dep(path, croptime=30, v_limit=None):
     '''
@@ -40,48 +46,37 @@ def read_time_dep(path, croptime=30, v_limit=None):
     df = df.set_index('Time (s)')  # convert to seconds
     df = df.set_index(df.index.values / 1000.0)
 
-    try:
-        currents = pd.unique(df['Setpoint'])
-    except:
-        currents = pd.unique(df['Ig (A) '])
-        df = df.rename(columns={'Ig (A) ': 'Current (A)'})
-
-    # crop the pre-trigger stuff
-    for i in currents:
-        d = df.loc[df['Setpoint'] == i]
-        f = d.index.searchsorted(croptime)
-        df = df.drop(d.index[:f])
-        if v_limit:
-            df = df.loc[np.abs(df['Voltage (V)']) <= np.abs(v_limit)]
+    df = _standard_columns(df)
+    currents = pd.unique(df['Setpoint'])
+
+    # crop the pre-trigger stuff, for all setpoints at once
+    keep = df.index.values >= croptime
+    if v_limit:
+        keep &= np.abs(df['Voltage (V)'].values) <= np.abs(v_limit)
+    rows = np.flatnonzero(keep)
+
+    # group the setpoints in order (stable, so time order within each is kept)
+    codes = pd.Categorical(df['Setpoint'].values[rows], categories=currents).codes
+    order = np.argsort(codes, kind='stable')
+    df = df.iloc[rows[order]]
+    bounds = np.searchsorted(codes[order], np.arange(len(currents) + 1))
+
+    # each setpoint starts at t = 0
+    tx = df.index.values
+    counts = np.diff(bounds)
+    t0 = np.repeat(tx[bounds[:-1][counts > 0]], counts[counts > 0])
+    df = df.set_axis(tx - t0, axis=0)
 
     # create a dict to separate the currents
     device = {}
-    for i in currents:
-        d = df.loc[df['Setpoint'] == i]
-        d = d.set_index(d.index.values - d.index.values[0])
-        device[i] = d
-
-    # concatenate the corrected index dataframes into a single DataFrame
-    _dv = [device[dv] for dv in device]
-    df = pd.DataFrame()
-    df = pd.concat(_dv)
+    for i, a, b in zip(currents, bounds[:-1], bounds[1:]):
+        device[i] = df.iloc[a:b].copy()
 
     # correct units to something useful
-    df['Ids (A)'] = df['Ids (A)'] * 1000
-    df['Error (A)'] = df['Error (A)'] * 1000
-    df['Current (A)'] = df['Current (A)'] * 1000
     setpointscale = False
     if np.where(np.abs(df['Setpoint'].values) < 1e-6)[0].any():  # quick way to see if voltages or current
         setpointscale = True
-        df['Setpoint'] = df['Setpoint'] * 1e9  # nA
-
-    df.index.rename('Time (ms)', inplace=True)
-    df.rename(columns={'Ids (A)': 'Ids (mA)', 'Error (A)': 'Error (mA)',
-                       'Current (A)': 'Current (mA)'}, inplace=True)
-    if setpointscale:
-        df.rename(columns={'Setpoint': 'Setpoint Current (nA)'}, inplace=True)
-    else:
-        df.rename(columns={'Setpoint': 'Setpoint Voltage (V)'}, inplace=True)
+    df = _convert_units(df, setpointscale)
 
     # Add the setpoints as attributes for easy reference
     try:
@@ -98,6 +93,103 @@ def read_time_dep(path, croptime=30, v_limit=None):
     return df, device
 
 
+def iter_time_dep(path, croptime=30, v_limit=None, convert=False, is_cc=None, chunksize=100000):
+    '''
+    Reads the time-dependent data in chunks and yields each setpoint as soon as
+    it has been read, so long logs can be processed without loading the whole file
+    
+    Setpoints are assumed to be measured one after another (as the VIs do); a
+    setpoint that appears again later is yielded again as a new segment.
+    Each segment is cropped and rebased to t=0 like read_time_dep
+    
+    croptime : int
+        Time index (s) to set as t=0 for the data
+    v_limit : float
+        Limits constant current data to when the voltage_compliance limit is reached
+    convert : bool, optional
+        False yields the segments as in the device dict from read_time_dep (A),
+        True as in the DataFrame (mA, setpoint current in nA)
+    is_cc : bool, optional
+        Whether this is constant current data (setpoints scaled to nA when convert).
+        By default guessed from the first setpoint, as read_time_dep does from all
+    chunksize : int, optional
+        Rows read at a time
+    
+    Yields:
+        
+    setpoint : float
+    d : DataFrame
+        The data for that setpoint
+    
+    Usage:
+        
+        >> for setpoint, d in transient.iter_time_dep(path):
+        >>     _, result = transient.model_friedlein({setpoint: d}, index=setpoint, plot=False)
+    '''
+    reader = pd.read_csv(path, sep='\t', chunksize=chunksize)
+    setpointscale = is_cc
+
+    chunks = (_standard_columns(chunk) for chunk in reader)
+
+    for setpoint, d in split_segments(chunks, 'Setpoint'):
+
+        d = d.set_index(d['Time (s)'].values / 1000.0)  # convert to seconds
+        d = d.drop(columns='Time (s)')
+
+        keep = d.index.values >= croptime
+        if v_limit:
+            keep &= np.abs(d['Voltage (V)'].values) <= np.abs(v_limit)
+        d = d[keep]
+        if d.empty:
+            continue
+
+        d = d.set_axis(d.index.values - d.index.values[0], axis=0)
+
+        if convert:
+            # decided on the first setpoint so all segments use the same units
+            if setpointscale is None:
+                setpointscale = np.abs(setpoint) < 1e-6  # quick way to see if voltages or current
+            d = _convert_units(d, setpointscale)
+
+        yield setpoint, d
+
+
+def _standard_columns(df):
+    '''
+    In older files the gate current is both the setpoint and the current, so it
+    is copied to Setpoint and renamed Current (A)
+    '''
+    column = setpoint_column(df.columns)
+
+    if column != 'Setpoint':
+        df = df.rename(columns={column: 'Current (A)'})
+        df['Setpoint'] = df['Current (A)']
+
+    return df
+
+
+def _convert_units(df, setpointscale):
+    '''
+    mA and nA units and column names as in the DataFrame from read_time_dep
+    (changes df)
+    '''
+    for c in ['Ids (A)', 'Error (A)', 'Current (A)']:
+        if c in df.columns:  # older files have no Error (A)
+            df[c] = df[c] * 1000
+    if setpointscale:
+        df['Setpoint'] = df['Setpoint'] * 1e9  # nA
+
+    df.index.rename('Time (ms)', inplace=True)
+    df.rename(columns={'Ids (A)': 'Ids (mA)', 'Error (A)': 'Error (mA)',
+                       'Current (A)': 'Current (mA)'}, inplace=True)
+    if setpointscale:
+        df.rename(columns={'Setpoint': 'Setpoint Current (nA)'}, inplace=True)
+    else:
+        df.rename(columns={'Setpoint': 'Setpoint Voltage (V)'}, inplace=True)
+
+    return df
+
+
 def plot_ccurrent(df, v_comp=-0.9):
     '''
     Only plots the current where voltage doesn't saturate
@@ -192,12 +284,17 @@ def friedlein_decay(t, mu, Cd, Cs, L, Vg, Rs, Vt, Vd, Ierr):
     return Ids
 
 
-def model_friedlein(device, index=-0.8, multi=True, params=None):
+def model_friedlein(device, index=-0.8, multi=True, params=None, plot=True, verbose=True):
     '''
     Wrapper for generating a friedlein_multi fit
+
+    plot : bool, optional
+        Plots the fit result
+    verbose : bool, optional
+        Prints the Vt preconditioning, fit report and tau
     '''
     if multi:
-        fmodel = lmfit.Model(friedlein_multi)
+        fmodel = lmfit.Model(friedlein_multi, independent_vars=['t'])  # not return_regime
     else:
         fmodel = lmfit.Model(friedlein_decay)
 
@@ -210,7 +307,8 @@ def model_friedlein(device, index=-0.8, multi=True, params=None):
     # pre-condition the Vt range
     value = getVt(params['Vt'], *preVt(params, t), params['Vd'])[0]
     params['Vt'].set(min=value * 0.3, max=value * 1.7, value=value)
-    print(params['Vt'])
+    if verbose:
+        print(params['Vt'])
 
     result = fmodel.fit(params=params, t=t, data=Ids, method='powell')
 
@@ -220,20 +318,23 @@ def model_friedlein(device, index=-0.8, multi=True, params=None):
     #    print(params['Vt'])
     #
     result = fmodel.fit(params=params, t=t, data=Ids, method='powell')
-    print(result.fit_report())
     p = result.params.valuesdict()
 
     C = p['Cd'] + p['Cs']
     tau = p['Rs'] * C
 
-    print('tau= ', tau, ' s')
-    result.plot(xlabel='Time (s)', ylabel='Ids (A)')
-    plt.tight_layout()
+    if verbose:
+        print(result.fit_report())
+        print('tau= ', tau, ' s')
+
+    if plot:
+        result.plot(xlabel='Time (s)', ylabel='Ids (A)')
+        plt.tight_layout()
 
     return fmodel, result
 
 
-def friedlein_multi(t, mu, Cd, Cs, L, Vg, Rs, Vt, Vd, Ierr):
+def friedlein_multi(t, mu, Cd, Cs, L, Vg, Rs, Vt, Vd, Ierr, return_regime=False):
     '''
     Modified version of the Friedlein model taking into account that we move
     from saturation to linear regime during the gate voltage pulse
@@ -248,60 +349,36 @@ def friedlein_multi(t, mu, Cd, Cs, L, Vg, Rs, Vt, Vd, Ierr):
         L = channel length (should be constant, in cm)
         mu = mobility (1e-8 to 10 cm^2/V*s is reasonable)
         Ierr = current error (y-offset)
+
+    return_regime : bool, optional
+        Also returns an array of 'sat', 'lin' or 'sub' for each time point
     
     '''
     #    C = Cd + Cs
     C = Cd + Cs
-    K = mu * C / L ** 2
     tau = Rs * C
 
-    Vch = Vg * (1 - np.exp(-t / tau))
-    Ids = np.zeros(len(t))
-    regime = []
-
-    sat = 0
-    lin = 0
-
     # For a given device, need Vt such that regimes meet.
     #    Vt0, _ = getVt(Vt, K, Vch, Vd)
     #    print('Vt', Vt0)
     Vt0 = Vt
 
-    for tm, x in zip(t, range(len(Ids))):
-
-        Vch = Vg * (1 - np.exp(-tm / tau))
-        # scale mobility with empirical carrier-dependent factor
-        p = (1 - np.exp(-tm / tau)) * (0.05 / 0.025 - 1)  # from 0 to ~3, 0.1=disorder width, 0.025 = kT/q
-
-        #        K = (C/L**2) * (1 - np.exp(-tm/tau))* mu   # represents increase in density
-        K = (C / L ** 2) * mu
-        # saturation
-        if Vch > Vt0 and Vd >= Vch:
-
-            # print('a')
-            regime.append('sat')
-            sat += 1
-
-            Ids[x] = 0.5 * K * (Vch - Vt0) ** 2 + Ierr
-
-        # linear
-        elif Vch > Vt0 and Vd < Vch:
+    t = np.asarray(t, dtype=float)
+    Vch = Vg * (1 - np.exp(-t / tau))
 
-            # print('b')
-            regime.append('lin')
-            lin += 1
+    #    K = (C/L**2) * (1 - np.exp(-t/tau))* mu   # represents increase in density
+    K = (C / L ** 2) * mu
 
-            Ids[x] = K * (Vch - Vt0 - Vd / 2) * Vd + Ierr
+    # saturation and subthreshold share the square law; linear once Vch passes Vd
+    on = Vch > Vt0
+    lin = on & (Vd < Vch)
 
-            # subthreshold
-        else:
+    Ids = np.where(lin, K * (Vch - Vt0 - Vd / 2) * Vd, 0.5 * K * (Vch - Vt0) ** 2) + Ierr
 
-            regime.append('sub')
-            Ids[x] = 0
-            Ids[x] = 0.5 * K * (Vch - Vt0) ** 2 + Ierr
+    if return_regime:
+        regime = np.where(lin, 'lin', np.where(on, 'sat', 'sub'))
+        return Ids, regime
 
-    #    print('sat', sat,'; lin', lin)
-    #    print(regime)
     return Ids
 
 
@@ -311,15 +388,18 @@ def vtdiff(Vt, K, Vch, Vd):
 
 def getVt(Vt, K, Vch, Vd):
     '''
-    Uses root solver to find minimum of difference between saturation line
+    Finds minimum of difference between saturation line
      and linear regime line (when they intersect)
     Does this for all values of Vch given the slow ionic charging
     The optimal threshold voltage defining the overlap is then extracted
     By default the plateau of Vch should be the right Vt, which is roots[-1]
+
+    vtdiff = 0.5 * K * (Vch - Vt - Vd)**2, so the root is Vt = Vch - Vd
+    (a double root) and all of Vch is solved at once, no root solver needed
     
     Parameters:
         Vt : float
-            Initial Vt guess
+            Initial Vt guess, returned where K = 0 (any Vt is then a root)
         K : float
             K = mu * (Cd + Cs)/L**2
         Vch : list or array
@@ -328,15 +408,17 @@ def getVt(Vt, K, Vch, Vd):
             drain voltage, should be fixed
     
     Returns:
-        roots : list
+        roots : ndarray
             All the roots at each time step 
         roots[-1] : float
             The final Vt 
     '''
-    roots = []
-    for v in Vch:
-        root = fsolve(vtdiff, Vt, args=(K, v, Vd))
-        roots.append(root[0])
+    Vch = np.asarray(Vch, dtype=float)
+
+    if K == 0:
+        roots = np.full(Vch.shape, float(Vt))
+    else:
+        roots = Vch - float(Vd)
 
     return roots[-1], roots
 
@@ -369,12 +451,114 @@ def fmParams(model):
     return params
 
 
+def fit_setpoints(paths, model='friedlein', setpoints=None, croptime=30, v_limit=None,
+                  workers=None, **kwargs):
+    '''
+    Fits every setpoint of one or more time-dependent files, without plotting
+
+    paths : str or list of str
+        A file from read_time_dep, a folder (all the .txt files in it are used),
+        or a list of files
+    model : str, optional
+        'friedlein' (model_friedlein) or 'faria' (fit_faria)
+    setpoints : list, optional
+        Only fit these setpoints (default is all in each file)
+    croptime, v_limit :
+        passed to read_time_dep
+    workers : int, optional
+        Number of processes to fit with. None (default) or 1 fits one at a time
+        in this process. On Windows, scripts using this need an
+        if __name__ == '__main__': guard
+    kwargs :
+        passed to the fit function (e.g. params, multi for model_friedlein)
+
+    Returns
+    -------
+    fits : DataFrame
+        One row per file, setpoint and fit parameter with columns
+        file, setpoint, model, parameter, value, stderr, redchi, success,
+        fit time (s) and error (the exception if that fit failed)
+    '''
+    if model not in ['friedlein', 'faria']:
+        raise ValueError('model must be friedlein or faria')
+
+    if isinstance(paths, str):
+        if os.path.isdir(paths):
+            paths = [os.path.join(paths, f) for f in sorted(os.listdir(paths)) if f[-4:] == '.txt']
+        else:
+            paths = [paths]
+
+    jobs = []
+    for path in paths:
+        _, device = read_time_dep(path, croptime=croptime, v_limit=v_limit)
+        for sp in device:
+            if setpoints is None or sp in setpoints:
+                jobs.append((path, sp, device[sp]))
+
+    if workers and workers > 1:
+
+        # each setpoint is independent; results are collected in submission order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_fit_setpoint, path, sp, d, model, kwargs)
+                       for path, sp, d in jobs]
+            rows = [r for future in futures for r in future.result()]
+
+    else:
+
+        rows = [r for path, sp, d in jobs for r in _fit_setpoint(path, sp, d, model, kwargs)]
+
+    columns = ['file', 'setpoint', 'model', 'parameter', 'value', 'stderr',
+               'redchi', 'success', 'fit time (s)', 'error']
+
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _fit_setpoint(path, setpoint, d, model, kwargs):
+    '''
+    Fits one setpoint DataFrame, returns rows for fit_setpoints
+    '''
+    row = {'file': os.path.basename(path), 'setpoint': setpoint, 'model': model}
+    start = time.perf_counter()
+
+    # the fits change params in place, so each setpoint starts from its own copy
+    # (as each job of the process pool does)
+    kwargs = copy.deepcopy(kwargs)
+
+    try:
+        if model == 'friedlein':
+            _, result = model_friedlein({setpoint: d}, index=setpoint, plot=False, verbose=False, **kwargs)
+        else:
+            _, result = fit_faria({setpoint: d}, key=setpoint, plot=False, verbose=False, **kwargs)
+
+    except Exception as e:
+        row.update({'fit time (s)': time.perf_counter() - start, 'error': repr(e)})
+        return [row]
+
+    row.update({'redchi': result.redchi, 'success': result.success,
+                'fit time (s)': time.perf_counter() - start})
+
+    rows = []
+    for name, par in result.params.items():
+        stderr = np.nan if par.stderr is None else par.stderr  # e.g. no covariance from powell
+        rows.append(dict(row, parameter=name, value=par.value, stderr=stderr))
+
+    return rows
+
+
 '''
 FARIA MODEL
 '''
 
 
-def fit_faria(device, key=-0.8):
+def fit_faria(device, key=-0.8, plot=True, verbose=True):
+    '''
+    Fits the Faria model to one setpoint of a device dict (from read_time_dep)
+
+    plot : bool, optional
+        Plots the fit result
+    verbose : bool, optional
+        Prints the fit report
+    '''
     famodel = lmfit.Model(faria)
     params = famodel.make_params(I0=0, V0=-0.85, gm=1e-3, Rd=1000, Rs=100,
                                  Cd=1, f=0.5)
@@ -395,10 +579,12 @@ def fit_faria(device, key=-0.8):
         print(result.fit_report())
         result.plot()
     '''
-    result = famodel.fit(params=params, t=device[-0.7].index,
+    result = famodel.fit(params=params, t=device[key].index,
                          data=device[key]['Ids (A)'])
-    print(result.fit_report())
-    result.plot()
+    if verbose:
+        print(result.fit_report())
+    if plot:
+        result.plot()
 
     return famodel, result
 
@@ -12,6 +12,10 @@ from scipy.optimize import curve_fit
 from scipy import integrate as spint
 import os
 import re
+import warnings
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import h5py
 from pathlib import Path
 
@@ -148,7 +152,7 @@ class uv_vis(object):
 
         return
 
-    def time_dep_spectra(self, specfiles, smooth=None, round_wl = 2, droptimes = None):
+    def time_dep_spectra(self, specfiles, smooth=None, round_wl = 2, droptimes = None, workers=None):
         '''
         Generates all the time-dependent spectra. This yields a dictionary where
         each voltage key contains the time-dependent spectra dataframe 
@@ -159,7 +163,8 @@ class uv_vis(object):
         This dict is the major component of this Class
         
         specfiles : list of str
-            Contains paths to the spectra files on the disk somewhere
+            Contains paths to the spectra files on the disk somewhere, one per
+            potential in self.potentials (in the same order)
         
         smooth : int, optional
             For smoothing the spectra via a boxcar filter. None = no smoothing
@@ -173,16 +178,35 @@ class uv_vis(object):
             Specific time indices to drop. This functionality is for initial or final
             errors in spectroelectrochemistry data
         
+        workers : int, optional
+            Number of processes to read the spectra files with. None (default) or 1
+            reads them one at a time. On Windows, scripts using this need an
+            if __name__ == '__main__': guard
+        
         '''
+        if len(specfiles) < len(self.potentials):
+            raise ValueError(str(len(specfiles)) + ' spectra files for ' + str(len(self.potentials)) + ' potentials')
+        
+        if len(specfiles) > len(self.potentials):
+            warnings.warn('Only the first ' + str(len(self.potentials)) + ' of ' + str(len(specfiles))
+                          + ' spectra files are used, one per potential')
+            specfiles = specfiles[:len(self.potentials)]
 
-        self.spectra_vs_time = {}
-        for v, r in zip(self.potentials, range(len(self.potentials))):
-            spectra_path = specfiles[r]
+        if workers and workers > 1:
             
-            df = self._single_time_spectra(spectra_path, smooth=smooth, digits=round_wl)
+            # executor.map returns the spectra in potential order
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                dfs = list(executor.map(read_time_spectra, specfiles,
+                                        repeat(smooth), repeat(round_wl)))
+        else:
+            
+            dfs = [read_time_spectra(fl, smooth=smooth, digits=round_wl) for fl in specfiles]
+
+        self.spectra_vs_time = {}
+        for v, df in zip(self.potentials, dfs):
             self.spectra_vs_time[v] = df
 
-        if any(droptimes):
+        if droptimes is not None and len(droptimes):
             for st in self.spectra_vs_time:
                 self.spectra_vs_time[st] = self.spectra_vs_time[st].drop(droptimes, axis=1)
 
@@ -195,51 +219,21 @@ class uv_vis(object):
         Generates the time-dependent spectra for a single dataframe.
         This is used internally to generate the dataFrame then passed to time_dep_spectra()
         
-        spectra_path : str
-            Path to a specific spectra file
-            
-        smooth : int, optional
-            For smoothing the data via a boxcar filter. None = no smoothing. 
-        
-        Returns
-        ---------
-        df : dataFrame
-            dataFrame of index = wavelength, columns = times, data = absorbance
-            
+        See read_time_spectra
         '''
+        return read_time_spectra(spectra_path, smooth=smooth, digits=digits)
 
-        pp = pd.read_csv(spectra_path, sep='\t')
-
-        try:
-            runs = np.unique(pp['Spectrum number'])
-        except:
-            wl = pp['Wavelength (nm)'][0]
-            runs = np.arange(1, len(np.where(pp['Wavelength (nm)'] == wl)[0]) + 1)
-
-        times = np.unique(pp['Time (s)'])
-        times = times - times[0]
-        per_run = int(len(pp) / runs[-1])
-        wl = pp['Wavelength (nm)'][0:per_run]
-
-        # Set up dataframe
-        df = pd.DataFrame(index=wl)
-        if digits:
-            df = df.set_index(np.round(df.index.values, digits)) # rounds wavelengths
-
-        for k, t in zip(runs, times):
-
-            try:
-                data = pp[pp['Spectrum number'] == k]['Absorbance'].values
-            except:
-                idx = per_run * (k - 1)
-                data = pp['Absorbance'].iloc[idx:idx + per_run].values
-
-            if smooth:
-                data = sg.fftconvolve(data, np.ones(smooth) / smooth, mode='same')
-
-            df[np.round(t, 2)] = pd.Series(data, index=df.index)
-
-        return df
+    def to_cube(self, path=None):
+        '''
+        Replaces spectra_vs_time with a SpectraCube (a single potential x wavelength
+        x time array). It can still be used like the dict of DataFrames
+        
+        path : str, optional
+            Folder to save the cube in; it is then memory-mapped from there
+        '''
+        self.spectra_vs_time = SpectraCube.from_dict(self.spectra_vs_time, path=path)
+        
+        return
 
     def spec_echem_voltage(self, time=0, smooth=3, digits=None):
         '''
@@ -265,6 +259,20 @@ class uv_vis(object):
             
         '''
 
+        if isinstance(self.spectra_vs_time, SpectraCube):
+            
+            # every potential at once
+            cube = self.spectra_vs_time
+            col = np.searchsorted(cube.times.values, time)
+            df = cube.time_slice(col)
+            df.index = df.index.values
+            data = sg.fftconvolve(df.values, np.ones(smooth)[:, None] / smooth, mode='same', axes=0)
+            
+            self.spectra = df
+            self.spectra_sm = pd.DataFrame(data, index=df.index, columns=df.columns)
+            
+            return
+
         wl = self.spectra_vs_time[0].index.values
 
         # Set up dataFrame
@@ -386,6 +394,16 @@ class uv_vis(object):
             tx = self.tx[-1]
         # self.vt = self.spectra.loc[idx[wl]]
 
+        if isinstance(self.spectra_vs_time, SpectraCube):
+            
+            # one strided read across all potentials
+            cube = self.spectra_vs_time
+            wl = cube.wavelengths.searchsorted(wavelength)
+            col = cube.times.get_loc(tx)
+            self.vt = pd.DataFrame({'Abs': cube.data[:, wl, col]}, index=cube.potentials)
+            
+            return
+
         vt = []
         vt = pd.DataFrame(columns=['Abs'])
         for dv in self.spectra_vs_time:
@@ -407,7 +425,7 @@ class uv_vis(object):
 
         return out
 
-    def banded_fits(self, wl_start=700, wl_stop=900, voltage=1, fittype='exp'):
+    def banded_fits(self, wl_start=700, wl_stop=900, voltage=1, fittype='exp', method='curve_fit', workers=None):
         '''
         Returns the fits from a range of spectra_vs_time data for a particular potential
         
@@ -423,39 +441,407 @@ class uv_vis(object):
             exp = single exponential (fastest)
             biexp = two exponentials
             stretched = stretched expontential
+        
+        method : str, optional
+            'curve_fit' (default) fits each wavelength from default guesses.
+            'vp' fits all wavelengths at once with exp_fits (much faster); biexp
+            and stretched fits then start from the neighbouring wavelength's result
+        
+        workers : int, optional
+            Number of processes for the biexp/stretched fits with method='vp'
+            (each takes a contiguous band of wavelengths)
             
         Generates
         -------
         fits : ndarray list
             Contains the fit values. Either a single entry list for exp or a list of
                 tuples for biexp and stretched
+        fit_params : DataFrame
+            All the fit parameters at each wavelength (method='vp' only)
         
         '''
 
-        wl_x = self.spectra_vs_time[voltage][wl_start:wl_stop]
-        tx = self.time_spectra_norm_sm.index.values
-
         if fittype not in ['exp', 'biexp', 'stretched']:
             raise ValueError('Fit must be exp, biexp, or stretched')
 
-        fits = []  # single exponential
+        if method not in ['vp', 'curve_fit']:
+            raise ValueError('method must be vp or curve_fit')
 
-        for wl in wl_x.index.values[1:]:
+        wl_x = self.spectra_vs_time[voltage][wl_start:wl_stop]
+
+        if method == 'curve_fit':
+            
+            tx = self.time_spectra_norm_sm.index.values
+            fits = []  # single exponential
 
-            if fittype == 'exp':
-                popt, _ = curve_fit(fit_exp, tx, self.spectra_vs_time[voltage].loc[wl])
-                fits.append(popt[2])
-            elif fittype == 'biexp':
-                popt, _ = curve_fit(fit_biexp, tx, self.spectra_vs_time[voltage].loc[wl])
-                fits.append((popt[2], popt[4]))
-            elif fittype == 'stretched':
-                popt, _ = curve_fit(fit_strexp, tx, self.spectra_vs_time[voltage].loc[wl])
-                fits.append((popt[2], popt[3]))
+            for wl in wl_x.index.values[1:]:
 
-        self.fits = np.array(fits)
+                if fittype == 'exp':
+                    popt, _ = curve_fit(fit_exp, tx, self.spectra_vs_time[voltage].loc[wl])
+                    fits.append(popt[2])
+                elif fittype == 'biexp':
+                    popt, _ = curve_fit(fit_biexp, tx, self.spectra_vs_time[voltage].loc[wl])
+                    fits.append((popt[2], popt[4]))
+                elif fittype == 'stretched':
+                    popt, _ = curve_fit(fit_strexp, tx, self.spectra_vs_time[voltage].loc[wl])
+                    fits.append((popt[2], popt[3]))
+
+            self.fits = np.array(fits)
+
+            return
+
+        # same wavelengths as above, time along axis 0
+        tx = wl_x.columns.values.astype(float)
+        wl = wl_x.index.values[1:]
+        data = wl_x.values[1:].T
+
+        y0, A, tau, _ = exp_fits(tx, data)
+
+        if fittype == 'exp':
+            
+            self.fits = tau
+            self.fit_params = pd.DataFrame({'y0': y0, 'A': A, 'tau': tau}, index=wl)
+            
+            return
+
+        if fittype == 'biexp':
+            func, names = fit_biexp, ['y0', 'A1', 'tau1', 'A2', 'tau2']
+            p0 = np.column_stack([y0, A / 2, tau / 3, A / 2, tau * 3])
+        else:
+            func, names = fit_strexp, ['y0', 'A', 'tau', 'beta']
+            p0 = np.column_stack([y0, A, tau, np.ones(len(tau))])
+
+        if workers and workers > 1:
+            
+            bands = np.array_split(np.arange(len(wl)), workers)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_warm_fits, func, tx, data[:, b], p0[b]) for b in bands]
+                popt = np.concatenate([f.result() for f in futures])
+        else:
+            
+            popt = _warm_fits(func, tx, data, p0)
+
+        self.fit_params = pd.DataFrame(popt, index=wl, columns=names)
+        if fittype == 'biexp':
+            self.fits = popt[:, [2, 4]]
+        else:
+            self.fits = popt[:, [2, 3]]
 
         return
 
+class SpectraCube(Mapping):
+    '''
+    The time-dependent spectra at every potential as a single
+    (potential x wavelength x time) array, optionally memory-mapped from disk.
+    
+    Behaves like the spectra_vs_time dict: cube[0.9] is a wavelength x time
+    DataFrame view (no copy) of that potential, and iterating gives the potentials.
+    
+    Usage:
+        
+        >> cube = uvvis.SpectraCube.from_dict(data.spectra_vs_time, path='cube')  # saves
+        >> cube = uvvis.SpectraCube.load('cube')  # memory-mapped, not read into RAM
+        >> cube.wavelength(800)  # potential x time at 800 nm, one strided read
+        >> data.spectra_vs_time = cube
+    
+    data : ndarray, memmap or h5py Dataset
+        (potential x wavelength x time) absorbance
+    potentials, wavelengths, times : array
+        The axes of data
+    index_name, columns_name : str, optional
+        Names of the wavelength index and time columns of the DataFrame views
+    '''
+    
+    def __init__(self, data, potentials, wavelengths, times, index_name=None, columns_name=None):
+        
+        self.data = data
+        self.potentials = np.asarray(potentials)
+        self.wavelengths = pd.Index(np.asarray(wavelengths), name=index_name)
+        self.times = pd.Index(np.asarray(times), name=columns_name)
+        self._positions = {p: n for n, p in enumerate(self.potentials)}
+        
+        if data.shape != (len(self.potentials), len(self.wavelengths), len(self.times)):
+            raise ValueError('data shape does not match the potential, wavelength and time axes')
+
+        return
+    
+    def __getitem__(self, potential):
+        
+        return pd.DataFrame(self.data[self._positions[potential]], index=self.wavelengths,
+                            columns=self.times, copy=False)
+    
+    def __iter__(self):
+        
+        return iter(self.potentials)
+    
+    def __len__(self):
+        
+        return len(self.potentials)
+    
+    @classmethod
+    def from_dict(cls, spectra_vs_time, path=None):
+        '''
+        Stacks a spectra_vs_time dict of DataFrames into a cube
+        
+        spectra_vs_time : dict
+            potential: DataFrame with the same wavelength index and time columns
+        path : str, optional
+            Folder to save the cube in (see save); it is then memory-mapped
+            instead of held in memory
+        '''
+        potentials = np.array(list(spectra_vs_time))
+        first = spectra_vs_time[potentials[0]]
+        shape = (len(potentials),) + first.shape
+        
+        for p in potentials:
+            df = spectra_vs_time[p]
+            if not (df.index.equals(first.index) and df.columns.equals(first.columns)):
+                raise ValueError('Spectra at ' + str(p) + ' V have different wavelengths or times')
+        
+        if path:
+            os.makedirs(path, exist_ok=True)
+            data = np.lib.format.open_memmap(os.path.join(path, 'spectra.npy'), mode='w+',
+                                             dtype=float, shape=shape)
+        else:
+            data = np.empty(shape)
+        
+        for n, p in enumerate(potentials):
+            data[n] = spectra_vs_time[p].values
+        
+        cube = cls(data, potentials, first.index.values, first.columns.values,
+                   first.index.name, first.columns.name)
+        
+        if path:
+            data.flush()
+            cube._save_axes(path)
+        
+        return cube
+    
+    def save(self, path):
+        '''
+        Saves to a folder: spectra.npy (the cube) and axes.npz (the axes)
+        '''
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'spectra.npy'), np.asarray(self.data))
+        self._save_axes(path)
+        
+        return
+    
+    def _save_axes(self, path):
+        
+        np.savez(os.path.join(path, 'axes.npz'), potentials=self.potentials,
+                 wavelengths=self.wavelengths.values, times=self.times.values,
+                 names=np.array([self.wavelengths.name or '', self.times.name or '']))
+        
+        return
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+        Opens a cube saved with save or from_dict
+        
+        mmap_mode : str, optional
+            Passed to np.load. 'r' (default) memory-maps the spectra read-only,
+            None reads them into memory
+        '''
+        data = np.load(os.path.join(path, 'spectra.npy'), mmap_mode=mmap_mode)
+        with np.load(os.path.join(path, 'axes.npz')) as axes:
+            names = [n if n else None for n in axes['names']]
+            cube = cls(data, axes['potentials'], axes['wavelengths'], axes['times'], *names)
+        
+        return cube
+    
+    def wavelength(self, wavelength):
+        '''
+        Absorbance vs time at every potential for the nearest wavelength (searchsorted)
+        
+        Returns a potential x time DataFrame
+        '''
+        n = self.wavelengths.searchsorted(wavelength)
+        
+        return pd.DataFrame(self.data[:, n, :], index=self.potentials, columns=self.times)
+    
+    def close(self):
+        '''
+        Closes the HDF5 file the cube is read from (see convert_h5)
+        '''
+        if hasattr(self.data, 'file'):
+            self.data.file.close()
+        
+        return
+    
+    def time_slice(self, n):
+        '''
+        The spectra at every potential for time column n, as a wavelength x potential DataFrame
+        '''
+        return pd.DataFrame(self.data[:, :, n].T, index=self.wavelengths, columns=self.potentials)
+
+
+def read_time_spectra(spectra_path, smooth=3, digits=None):
+    '''
+    Generates the time-dependent spectra from a single spectra file.
+    Used by uv_vis.time_dep_spectra() for each potential
+    
+    spectra_path : str
+        Path to a specific spectra file
+        
+    smooth : int, optional
+        For smoothing the data via a boxcar filter. None = no smoothing. 
+    
+    Returns
+    ---------
+    df : dataFrame
+        dataFrame of index = wavelength, columns = times, data = absorbance
+        
+    '''
+
+    pp = pd.read_csv(spectra_path, sep='\t')
+
+    try:
+        runs = np.unique(pp['Spectrum number'])
+    except:
+        wl = pp['Wavelength (nm)'][0]
+        runs = np.arange(1, len(np.where(pp['Wavelength (nm)'] == wl)[0]) + 1)
+
+    times = np.unique(pp['Time (s)'])
+    times = times - times[0]
+    per_run = int(len(pp) / runs[-1])
+    wl = pp['Wavelength (nm)'][0:per_run]
+    n = min(len(runs), len(times))
+
+    # (wavelength x time) array, one column per spectrum
+    absorbance = pp['Absorbance'].values
+    if 'Spectrum number' in pp:
+        order = np.argsort(pp['Spectrum number'].values, kind='stable')
+        absorbance = absorbance[order]
+    data = absorbance[:per_run * n].reshape(n, per_run).T
+
+    if smooth:
+        data = sg.fftconvolve(data, np.ones(smooth)[:, None] / smooth, mode='same', axes=0)
+
+    # times that round to the same value keep the last spectrum, in the first one's place
+    cols = np.round(times[:n], 2)
+    _, first = np.unique(cols, return_index=True)
+    _, last = np.unique(cols[::-1], return_index=True)
+    keep = (n - 1 - last)[np.argsort(first)]
+
+    index = pd.Index(wl)
+    if digits:
+        index = pd.Index(np.round(index.values, digits)) # rounds wavelengths
+
+    df = pd.DataFrame(data[:, keep], index=index, columns=cols[keep])
+
+    return df
+
+
+def exp_fits(t, data, taus=None, tol=1e-6):
+    '''
+    Fits y0 + A * exp(-t / tau) to every column of data at once
+    
+    For a fixed tau the model is linear in y0 and A, so those are solved in closed
+    form (variable projection) and only tau is searched: on a log grid first, then
+    by golden-section search between the grid points around each column's best
+    
+    t : array
+        Time axis, length T
+    data : ndarray
+        (T x N) data, one trace per column
+    taus : array, optional
+        tau grid. Default is 200 points log-spaced from 1/10 of the smallest
+        time step to 10x the time span
+    tol : float, optional
+        Relative tolerance on tau
+    
+    Returns
+    -------
+    y0, A, tau, ssr : ndarray
+        Fit parameters and sum of squared residuals for each column
+    '''
+    t = np.asarray(t, dtype=float)
+    Y = np.asarray(data, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+
+    if taus is None:
+        dt = np.diff(t)
+        taus = np.logspace(np.log10(np.min(dt[dt > 0]) / 10), np.log10((t[-1] - t[0]) * 10), 200)
+
+    n = len(t)
+    Sy = Y.sum(axis=0)
+    syy = (Y * Y).sum(axis=0) - Sy ** 2 / n
+
+    def _fit(X, Sxy):
+        # line fit of each column of Y vs X (one X per tau); nan where X is ~constant
+        Sx = X.sum(axis=0)
+        sxx = (X * X).sum(axis=0) - Sx ** 2 / n
+        if Sxy.ndim == 2:
+            Sx, sxx = Sx[:, None], sxx[:, None]
+        sxy = Sxy - Sx * Sy / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            A = sxy / sxx
+            ssr = syy - sxy * A
+        return A, (Sy - A * Sx) / n, np.where(np.isfinite(ssr), ssr, np.inf)
+
+    # grid search, (taus x columns)
+    X = np.exp(-t[:, None] / taus[None, :])
+    _, _, ssr = _fit(X, X.T @ Y)
+    k = np.argmin(ssr, axis=0)
+
+    # golden-section search in log(tau)
+    a = np.log(taus[np.maximum(k - 1, 0)])
+    b = np.log(taus[np.minimum(k + 1, len(taus) - 1)])
+    g = (np.sqrt(5) - 1) / 2
+
+    def _ssr(logtau):
+        X = np.exp(-t[:, None] / np.exp(logtau)[None, :])
+        return _fit(X, (X * Y).sum(axis=0))[2]
+
+    while np.max(b - a) > tol:
+        c = b - g * (b - a)
+        d = a + g * (b - a)
+        left = _ssr(c) < _ssr(d)
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+
+    tau = np.exp((a + b) / 2)
+    X = np.exp(-t[:, None] / tau[None, :])
+    A, y0, ssr = _fit(X, (X * Y).sum(axis=0))
+
+    return y0, A, tau, ssr
+
+
+def _warm_fits(func, t, data, p0):
+    '''
+    curve_fit of func to each column of data in order. Each is started from the
+    previous column's result and from p0 of that column, keeping the better fit
+    (a neighbour's result alone can carry a degenerate fit along the band)
+    
+    Returns (columns x parameters) array, nan for fits that failed
+    '''
+    popt = np.full(p0.shape, np.nan)
+    prev = None
+
+    for j in range(data.shape[1]):
+        
+        y = data[:, j]
+        best = np.inf
+        starts = [p0[j]] if prev is None else [prev, p0[j]]
+        
+        for start in starts:
+            try:
+                p, _ = curve_fit(func, t, y, p0=start)
+            except (RuntimeError, ValueError):
+                continue
+            
+            ssr = np.sum((y - func(t, *p)) ** 2)
+            if ssr < best:
+                best = ssr
+                popt[j] = p
+        
+        prev = popt[j] if np.isfinite(best) else None
+
+    return popt
+
 
 def fit_exp(t, y0, A, tau):
     return y0 + A * np.exp(-t / tau)
@@ -613,9 +999,18 @@ def spectrogram(uv, potential=0.8, **kwargs):
 
     return ax
 
-def save_h5(data, filename):
+def save_h5(data, filename, legacy=False, compression='gzip'):
     '''
     Saves the to two HDF5 files (.h5)
+    
+    By default the spectra are one chunked, compressed (potential x wavelength x time)
+    dataset 'spectra/values' with its axes in 'spectra/potentials', 'spectra/wavelengths'
+    and 'spectra/times', so convert_h5 can read them lazily
+    
+    legacy : bool, optional
+        Writes each potential with DataFrame.to_hdf instead (needs pytables)
+    compression : str, optional
+        h5py compression filter for the spectra, None for none
     '''
     
     if isinstance(filename, str):
@@ -629,8 +1024,23 @@ def save_h5(data, filename):
             dset[:] = data.charge.values[0][:]
         except:
             pass
+        
+        if not legacy:
+            _write_h5_spectra(f, data.spectra_vs_time, compression)
+            
+            # same layout as DataFrame.to_hdf, which convert_h5 already reads
+            try:
+                current = f.create_group('current')
+                current['block0_values'] = data.current.values
+                current['axis0'] = data.current.columns.values
+                current['axis1'] = data.current.index.values
+            except AttributeError:  # no current
+                del f['current']
     f.close()
     
+    if not legacy:
+        return
+    
     for p in data.spectra_vs_time:
         data.spectra_vs_time[p].to_hdf(filename, key=str(p), mode='a')
     
@@ -641,18 +1051,72 @@ def save_h5(data, filename):
     
     return
 
-def convert_h5(h5file):
+
+def _write_h5_spectra(f, spectra_vs_time, compression='gzip'):
+    '''
+    Writes a spectra_vs_time dict (or SpectraCube) as one chunked cube in group 'spectra'
+    '''
+    potentials = np.array(list(spectra_vs_time))
+    first = spectra_vs_time[potentials[0]]
+    n_wl, n_t = first.shape
+    
+    grp = f.create_group('spectra')
+    grp.attrs['layout'] = 'cube'
+    grp.attrs['index_name'] = first.index.name or ''
+    grp.attrs['columns_name'] = first.columns.name or ''
+    grp['potentials'] = potentials
+    grp['wavelengths'] = first.index.values
+    grp['times'] = first.columns.values.astype(float)
+    
+    # a chunk holds a band of wavelengths over a stretch of time at one potential,
+    # so a kinetic trace or a spectrum only reads a few chunks
+    chunks = (1, min(n_wl, 64), min(n_t, 256))
+    dset = grp.create_dataset('values', (len(potentials), n_wl, n_t), dtype=float,
+                              chunks=chunks, compression=compression, shuffle=compression is not None)
+    
+    for n, p in enumerate(potentials):
+        df = spectra_vs_time[p]
+        if not (df.index.equals(first.index) and df.columns.equals(first.columns)):
+            raise ValueError('Spectra at ' + str(p) + ' V have different wavelengths or times; use legacy=True')
+        dset[n] = df.values
+    
+    return
+
+
+def convert_h5(h5file, lazy=True):
     '''
     Converts a saved hdf5 to uvvis Class format
     
     axis0 = time
     axis1 = wavelength
     block0_items
+    
+    Files written by save_h5 (not legacy) give a SpectraCube as spectra_vs_time
+    
+    lazy : bool, optional
+        For those files, leaves the spectra on disk and reads only what is used,
+        e.g. data.spectra_vs_time.wavelength(800). The file stays open until
+        data.spectra_vs_time.close()
     '''
     data = uv_vis(None,None,None)
     file =  h5py.File(h5file, 'r')
     data.potentials = file['potentials'][()]
     
+    if 'spectra' in file and file['spectra'].attrs.get('layout') == 'cube':
+        
+        grp = file['spectra']
+        values = grp['values'] if lazy else grp['values'][()]
+        data.spectra_vs_time = SpectraCube(values, grp['potentials'][()], grp['wavelengths'][()],
+                                           grp['times'][()], grp.attrs['index_name'] or 'Wavelength (nm)',
+                                           grp.attrs['columns_name'] or 'Time (s)')
+        data.tx = np.round(grp['times'][()], 2)
+        
+        _read_h5_current(file, data)
+        if not lazy:
+            file.close()
+        
+        return data
+    
     folders = []
     for f in file:
         folders.append(f)
@@ -685,6 +1149,18 @@ def convert_h5(h5file):
     data.spectra_vs_time = df_dict
     
     # Now get the current data
+    _read_h5_current(file, data)
+    
+    file.close()
+    
+    return data
+
+
+def _read_h5_current(file, data):
+    
+    if 'current' not in file:
+        return
+    
     current = pd.DataFrame(data = file['current']['block0_values'][()],
                            index = file['current']['axis1'][()],
                            columns = file['current']['axis0'])
@@ -696,6 +1172,4 @@ def convert_h5(h5file):
     data.charge = pd.DataFrame(data = file['charge'][()],
                                index = data.potentials.T)
     
-    file.close()
-    
-    return data
\ No newline at end of file
+    return
\ No newline at end of file